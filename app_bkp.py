@@ -1,9 +1,16 @@
 import streamlit as st
 import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
+import pyarrow as pa
+import pyarrow.compute as pc
+import numpy as np
 import warnings
 import io
+import time
+import tempfile
+import hashlib
+from pathlib import Path
+import utils
+from utils import baixar_csv, figura_ranking, gravar_parquet, indexar_por_ano, maiores_valores, opcoes_do_recorte, opcoes_unicas, ranking_empresas, recortar_ano
 
 # Ignorar avisos de depreciação futuros do pandas que podem poluir a saída
 warnings.simplefilter(action='ignore', category=FutureWarning)
@@ -12,102 +19,242 @@ warnings.simplefilter(action='ignore', category=FutureWarning)
 st.set_page_config(layout="wide", page_title="Análise de Remuneração CVM")
 
 
+# --- Mapeamento de Colunas ---
+# Mapeamento completo e flexível das colunas para nomes padronizados.
+RENAME_MAP = {
+    # Identificação e Filtros Novos
+    'NOME_COMPANHIA': ['DENOM_CIA'],
+    'ANO_REFER': ['Ano do Exercício Social'],
+    'ORGAO_ADMINISTRACAO': ['Orgao_Administracao'],
+    'SETOR_ATIVIDADE': ['SETOR_DE_ATIVDADE', 'Setor de ativdade', 'Setor de Atividade', 'SETOR', 'ATIVIDADE'],
+    'CONTROLE_ACIONARIO': ['CONTROLE_ACIONARIO'],
+    'UF_SEDE': ['UF_SEDE'],
+    
+    # Bloco 1: Remuneração Individual (Máx/Média/Mín)
+    'NUM_MEMBROS_INDIVIDUAL': ['Quantidade_Membros_Orgao_Remuneracao_Individual'],
+    'REM_MAXIMA_INDIVIDUAL': ['Valor_Maior_Remuneracao_Individual_Reconhecida_Exercicio', 'Valor_Maior_Remuneracao_Individual', 'REMUNERACAO_MAXIMA', 'VALOR_MAIOR_REMUNERACAO'],
+    'REM_MEDIA_INDIVIDUAL': ['Valor_Medio_Remuneracao_Individual_Reconhecida_Exercicio', 'Valor_Medio_Remuneracao_Individual', 'REMUNERACAO_MEDIA', 'VALOR_MEDIO_REMUNERACAO'],
+    'REM_MINIMA_INDIVIDUAL': ['Valor_Menor_Remuneracao_Individual_Reconhecida_Exercicio', 'Valor_Menor_Remuneracao_Individual', 'REMUNERACAO_MINIMA', 'VALOR_MENOR_REMUNERACAO'],
+    'DESVIO_PADRAO_INDIVIDUAL': ['Desvio_Padrao_Remuneracao_Individual_Reconhecida_Exercicio', 'DESVIO_PADRAO'],
+
+    # Bloco 2: Componentes da Remuneração Total
+    'NUM_MEMBROS_TOTAL': ['Quantidade_Total_Membros_Remunerados_Orgao', 'QTD_MEMBROS_REMUNERADOS_TOTAL'],
+    'REM_FIXA_SALARIO': ['SALARIO'],
+    'REM_FIXA_BENEFICIOS': ['BENEFICIOS_DIRETOS_INDIRETOS'],
+    'REM_FIXA_COMITES': ['PARTICIPACOES_COMITES'],
+    'REM_FIXA_OUTROS': ['OUTROS_VALORES_FIXOS'],
+    'REM_VAR_BONUS': ['BONUS'],
+    'REM_VAR_PLR': ['PARTICIPACAO_RESULTADOS'],
+    'REM_VAR_REUNIOES': ['PARTICIPACAO_REUNIOES'],
+    'REM_VAR_COMISSOES': ['COMISSOES'],
+    'REM_VAR_OUTROS': ['OUTROS_VALORES_VARIAVEIS'],
+    'REM_POS_EMPREGO': ['POS_EMPREGO'],
+    'REM_CESSACAO_CARGO': ['CESSACAO_CARGO'],
+    'REM_ACOES_BLOCO3': ['BASEADA_ACOES'],
+    'TOTAL_REMUNERACAO_ORGAO': ['TOTAL_REMUNERACAO_ORGAO'],
+
+    # Bloco 3: Métricas de Bônus e PLR
+    'NUM_MEMBROS_BONUS_PLR': ['QTD_MEMBROS_REMUNERADOS_VARIAVEL'],
+    'BONUS_MIN': ['BONUS_VALOR_MINIMO'],
+    'BONUS_MAX': ['BONUS_VALOR_MAXIMO'],
+    'BONUS_ALVO': ['BONUS_VALOR_METAS_ATINGIDAS'],
+    'BONUS_PAGO': ['BONUS_VALOR_EFETIVO'],
+    'PLR_MIN': ['PARTICIPACAO_VALOR_MINIMO'],
+    'PLR_MAX': ['PARTICIPACAO_VALOR_MAXIMO'],
+    'PLR_ALVO': ['PARTICIPACAO_VALOR_METAS_ATINGIDAS'],
+    'PLR_PAGO': ['PARTICIPACAO_VALOR_EFETIVO'],
+}
+
+# Índice invertido (nome original -> nome padronizado), construído uma única vez por processo.
+# A ordem de inserção preserva a prioridade dos aliases de cada coluna padronizada.
+ALIAS_PARA_PADRAO = {old_name: new_name for new_name, old_names in RENAME_MAP.items() for old_name in old_names}
+
+# Colunas numéricas identificadas pelas palavras-chave do nome padronizado
+NUMERIC_KEYWORDS = ('NUM', 'VALOR', 'TOTAL', 'REM', 'PERC', 'BONUS', 'PLR', 'DESVIO')
+NUMERIC_COLS = [col for col in RENAME_MAP if any(k in col for k in NUMERIC_KEYWORDS)]
+
+
+# --- Cópia Local em Parquet ---
+# O DataFrame já tratado (só com as colunas padronizadas) é gravado em Parquet na primeira carga;
+# os reinícios seguintes leem o arquivo colunar em vez de interpretar o CSV. O nome leva a versão
+# do tratamento (incrementar ao mudar load_data) e o arquivo é renovado após MAX_IDADE_PARQUET segundos.
+VERSAO_PARQUET = 3
+CAMINHO_PARQUET = Path(tempfile.gettempdir()) / f"dados_cvm_v{VERSAO_PARQUET}.parquet"
+MAX_IDADE_PARQUET = 12 * 60 * 60
+COLUNAS_USADAS = list(RENAME_MAP)
+
+# Colunas que cada análise lê, além das dos filtros globais: do Parquet só se carrega o necessário
+COLUNAS_FILTROS = ['UF_SEDE', 'SETOR_ATIVIDADE', 'CONTROLE_ACIONARIO']
+COLUNAS_POR_PAGINA = {
+    "Página Inicial": [],
+    "Remuneração Individual (Máx/Média/Mín)": ['NOME_COMPANHIA', 'ANO_REFER', 'ORGAO_ADMINISTRACAO', 'REM_MAXIMA_INDIVIDUAL', 'REM_MEDIA_INDIVIDUAL', 'REM_MINIMA_INDIVIDUAL'],
+    "Componentes da Remuneração Total": ['NOME_COMPANHIA', 'ANO_REFER', 'ORGAO_ADMINISTRACAO', 'NUM_MEMBROS_TOTAL', 'TOTAL_REMUNERACAO_ORGAO',
+                                         'REM_FIXA_SALARIO', 'REM_FIXA_BENEFICIOS', 'REM_FIXA_COMITES', 'REM_FIXA_OUTROS', 'REM_VAR_BONUS',
+                                         'REM_VAR_PLR', 'REM_VAR_COMISSOES', 'REM_POS_EMPREGO', 'REM_CESSACAO_CARGO', 'REM_ACOES_BLOCO3'],
+    "Bônus e PLR": ['NOME_COMPANHIA', 'ANO_REFER', 'ORGAO_ADMINISTRACAO', 'NUM_MEMBROS_BONUS_PLR',
+                    'BONUS_MIN', 'BONUS_MAX', 'BONUS_ALVO', 'BONUS_PAGO', 'PLR_MIN', 'PLR_MAX', 'PLR_ALVO', 'PLR_PAGO'],
+    "Análise Estatística (Quartis)": ['ANO_REFER', 'ORGAO_ADMINISTRACAO', 'NUM_MEMBROS_INDIVIDUAL', 'REM_MAXIMA_INDIVIDUAL', 'REM_MEDIA_INDIVIDUAL',
+                                      'REM_MINIMA_INDIVIDUAL', 'NUM_MEMBROS_TOTAL', 'TOTAL_REMUNERACAO_ORGAO', 'REM_FIXA_SALARIO',
+                                      'NUM_MEMBROS_BONUS_PLR', 'BONUS_PAGO'],
+}
+
+def colunas_da_pagina(pagina: str) -> tuple:
+    """Colunas (na ordem de COLUNAS_USADAS) lidas para uma análise, incluindo as dos filtros globais."""
+    necessarias = set(COLUNAS_FILTROS) | set(COLUNAS_POR_PAGINA[pagina])
+    return tuple(col for col in COLUNAS_USADAS if col in necessarias)
+
+
 # --- Funções Auxiliares ---
-@st.cache_data
-def load_data(url: str) -> pd.DataFrame:
+# Em memória vale pelo mesmo prazo do Parquet, que é a camada em disco entre reinícios
+# Uma entrada por conjunto de colunas (análise). cache_resource: todas as sessões e reruns recebem o
+# mesmo DataFrame, sem a cópia (unpickle) que o cache_data faria a cada chamada; as páginas só o leem
+@st.cache_resource(ttl=MAX_IDADE_PARQUET, max_entries=len(COLUNAS_POR_PAGINA), show_spinner="Carregando dados da CVM...")
+def load_data(url: str, colunas: tuple = tuple(COLUNAS_USADAS)) -> tuple[pd.DataFrame, list[str]]:
     """
     Carrega os dados de uma URL, limpa, e renomeia colunas de forma robusta
     para facilitar as análises, espelhando a estrutura de blocos da CVM.
+    Devolve só as 'colunas' pedidas; o Parquet guarda todas e é lido apenas nelas.
+    Retorna também os avisos da carga, exibidos pelo main() (fora do cache).
+    Erros são propagados: o cache_resource não guarda exceções, então a próxima execução tenta de novo.
     """
+    avisos = []
+    if CAMINHO_PARQUET.exists() and time.time() - CAMINHO_PARQUET.stat().st_mtime < MAX_IDADE_PARQUET:
+        try:
+            df = pd.read_parquet(CAMINHO_PARQUET, columns=list(colunas), engine='pyarrow')
+        except Exception:
+            pass  # Cópia local ilegível: refaz a partir do CSV (e a regrava)
+        else:
+            # Versões antigas do pandas não gravam df.attrs no Parquet
+            if 'versao' not in df.attrs:
+                df.attrs['versao'] = int(pd.util.hash_pandas_object(df, index=False).sum())
+            return df, list(df.attrs.get('avisos', []))
+
+    raw = baixar_csv(url)  # mesmo cache de download do app multipáginas
+
+    # O renomeio é resolvido só pelo cabeçalho, antes de interpretar o arquivo
+    # CORREÇÃO DE ACENTUAÇÃO: Alterado encoding para utf-8-sig
+    cabecalho_bruto = pd.read_csv(io.BytesIO(raw), sep=',', encoding='utf-8-sig', nrows=0).columns
+    cabecalho = cabecalho_bruto.str.strip()
+
+    colunas_existentes = set(cabecalho)
+    actual_rename_dict = {}
+    colunas_resolvidas = set()
+    for old_name, new_name in ALIAS_PARA_PADRAO.items():
+        if old_name in colunas_existentes and new_name not in colunas_resolvidas:
+            actual_rename_dict[old_name] = new_name
+            colunas_resolvidas.add(new_name)
+    
+    # --- Verificação por Posição (Plano B) ---
+    # Colunas que já chegam com o nome padronizado são mantidas como estão
+    colunas_padrao = colunas_existentes & set(RENAME_MAP)
+    if 'SETOR_ATIVIDADE' not in colunas_resolvidas | colunas_padrao and len(cabecalho) >= 42:
+        actual_rename_dict[cabecalho[41]] = 'SETOR_ATIVIDADE' # Posição 42 é índice 41
+        avisos.append("Coluna de setor identificada pela posição no arquivo (Plano B).")
+
+    # Lê apenas as colunas padronizadas ou a renomear (as demais nunca são usadas), com o leitor
+    # multithread do PyArrow; o motor C fica de reserva se ele falhar
+    colunas_lidas = colunas_padrao | set(actual_rename_dict)
+    colunas_brutas = [col for col in cabecalho_bruto if col.strip() in colunas_lidas]
     try:
-        # CORREÇÃO DE ACENTUAÇÃO: Alterado encoding para utf-8-sig
-        df = pd.read_csv(url, sep=',', encoding='utf-8-sig', engine='python')
-        df.columns = df.columns.str.strip()
-
-        # Mapeamento completo e flexível das colunas para nomes padronizados.
-        rename_map = {
-            # Identificação e Filtros Novos
-            'NOME_COMPANHIA': ['DENOM_CIA'],
-            'ANO_REFER': ['Ano do Exercício Social'],
-            'ORGAO_ADMINISTRACAO': ['Orgao_Administracao'],
-            'SETOR_ATIVIDADE': ['SETOR_DE_ATIVDADE', 'Setor de ativdade', 'Setor de Atividade', 'SETOR', 'ATIVIDADE'],
-            'CONTROLE_ACIONARIO': ['CONTROLE_ACIONARIO'],
-            'UF_SEDE': ['UF_SEDE'],
-            
-            # Bloco 1: Remuneração Individual (Máx/Média/Mín)
-            'NUM_MEMBROS_INDIVIDUAL': ['Quantidade_Membros_Orgao_Remuneracao_Individual'],
-            'REM_MAXIMA_INDIVIDUAL': ['Valor_Maior_Remuneracao_Individual_Reconhecida_Exercicio', 'Valor_Maior_Remuneracao_Individual', 'REMUNERACAO_MAXIMA', 'VALOR_MAIOR_REMUNERACAO'],
-            'REM_MEDIA_INDIVIDUAL': ['Valor_Medio_Remuneracao_Individual_Reconhecida_Exercicio', 'Valor_Medio_Remuneracao_Individual', 'REMUNERACAO_MEDIA', 'VALOR_MEDIO_REMUNERACAO'],
-            'REM_MINIMA_INDIVIDUAL': ['Valor_Menor_Remuneracao_Individual_Reconhecida_Exercicio', 'Valor_Menor_Remuneracao_Individual', 'REMUNERACAO_MINIMA', 'VALOR_MENOR_REMUNERACAO'],
-            'DESVIO_PADRAO_INDIVIDUAL': ['Desvio_Padrao_Remuneracao_Individual_Reconhecida_Exercicio', 'DESVIO_PADRAO'],
-
-            # Bloco 2: Componentes da Remuneração Total
-            'NUM_MEMBROS_TOTAL': ['Quantidade_Total_Membros_Remunerados_Orgao', 'QTD_MEMBROS_REMUNERADOS_TOTAL'],
-            'REM_FIXA_SALARIO': ['SALARIO'],
-            'REM_FIXA_BENEFICIOS': ['BENEFICIOS_DIRETOS_INDIRETOS'],
-            'REM_FIXA_COMITES': ['PARTICIPACOES_COMITES'],
-            'REM_FIXA_OUTROS': ['OUTROS_VALORES_FIXOS'],
-            'REM_VAR_BONUS': ['BONUS'],
-            'REM_VAR_PLR': ['PARTICIPACAO_RESULTADOS'],
-            'REM_VAR_REUNIOES': ['PARTICIPACAO_REUNIOES'],
-            'REM_VAR_COMISSOES': ['COMISSOES'],
-            'REM_VAR_OUTROS': ['OUTROS_VALORES_VARIAVEIS'],
-            'REM_POS_EMPREGO': ['POS_EMPREGO'],
-            'REM_CESSACAO_CARGO': ['CESSACAO_CARGO'],
-            'REM_ACOES_BLOCO3': ['BASEADA_ACOES'],
-            'TOTAL_REMUNERACAO_ORGAO': ['TOTAL_REMUNERACAO_ORGAO'],
-
-            # Bloco 3: Métricas de Bônus e PLR
-            'NUM_MEMBROS_BONUS_PLR': ['QTD_MEMBROS_REMUNERADOS_VARIAVEL'],
-            'BONUS_MIN': ['BONUS_VALOR_MINIMO'],
-            'BONUS_MAX': ['BONUS_VALOR_MAXIMO'],
-            'BONUS_ALVO': ['BONUS_VALOR_METAS_ATINGIDAS'],
-            'BONUS_PAGO': ['BONUS_VALOR_EFETIVO'],
-            'PLR_MIN': ['PARTICIPACAO_VALOR_MINIMO'],
-            'PLR_MAX': ['PARTICIPACAO_VALOR_MAXIMO'],
-            'PLR_ALVO': ['PARTICIPACAO_VALOR_METAS_ATINGIDAS'],
-            'PLR_PAGO': ['PARTICIPACAO_VALOR_EFETIVO'],
-        }
-
-        actual_rename_dict = {}
-        for new_name, old_names in rename_map.items():
-            for old_name in old_names:
-                if old_name in df.columns:
-                    actual_rename_dict[old_name] = new_name
-                    break
-        df.rename(columns=actual_rename_dict, inplace=True)
-        
-        # --- Verificação por Posição (Plano B) ---
-        if 'SETOR_ATIVIDADE' not in df.columns and len(df.columns) >= 42:
-            target_col_name = df.columns[41] # Posição 42 é índice 41
-            df.rename(columns={target_col_name: 'SETOR_ATIVIDADE'}, inplace=True)
-            
+        df = pd.read_csv(io.BytesIO(raw), sep=',', encoding='utf-8-sig', engine='pyarrow',
+                         usecols=colunas_brutas, na_values=[''])
+    except Exception:
+        df = pd.read_csv(io.BytesIO(raw), sep=',', encoding='utf-8-sig', engine='c', low_memory=False,
+                         usecols=lambda col: col.strip() in colunas_lidas, na_values=[''])
+    df.columns = df.columns.str.strip()
+    df.rename(columns=actual_rename_dict, inplace=True)
+
+
+    # Converte todas as colunas numéricas de uma vez
+    presentes = [col for col in NUMERIC_COLS if col in df.columns]
+    ausentes = [col for col in NUMERIC_COLS if col not in df.columns]
+    df[presentes] = df[presentes].apply(pd.to_numeric, errors='coerce').fillna(0.0)
+    df[ausentes] = 0.0
+
+    # Limpeza e Padronização de Dados Categóricos
+    categorical_cols = ['NOME_COMPANHIA', 'ORGAO_ADMINISTRACAO', 'SETOR_ATIVIDADE', 'CONTROLE_ACIONARIO', 'UF_SEDE']
+    for col in categorical_cols:
+        if col in df.columns:
+            # strip/upper com os kernels do PyArrow, direto sobre os buffers UTF-8; nulos recebem o rótulo padrão
+            texto = pc.utf8_upper(pc.utf8_trim_whitespace(pa.array(df[col].astype('string[pyarrow]'))))
+            df[col] = pc.fill_null(texto, f'{col.replace("_", " ").title()} Não Informado').to_pandas()
+        else:
+            avisos.append(f"Atenção: A coluna para '{col}' não foi encontrada. Um valor padrão será usado.")
+            df[col] = f"{col.replace('_', ' ').title()} Não Informado"
+        # Categórica: filtros e groupbys passam a operar sobre códigos inteiros
+        df[col] = df[col].astype('category')
+
+    if 'ANO_REFER' in df.columns:
+        df['ANO_REFER'] = pd.to_numeric(df['ANO_REFER'], errors='coerce').dropna().astype(int)
+
+    # A cópia consolida os blocos: cada coluna numérica fica contígua num único bloco float64
+    df = df[[col for col in COLUNAS_USADAS if col in df.columns]].copy()
+    df.attrs['avisos'] = avisos
+    # Versão do conteúdo (sha256 do CSV, com o formato do tratamento): entra na chave dos caches de
+    # filtros e agregações, que assim não sobrevivem a uma recarga com dados novos
+    df.attrs['versao'] = f"{VERSAO_PARQUET}-{hashlib.sha256(raw).hexdigest()[:16]}"
+    try:
+        gravar_parquet(df, CAMINHO_PARQUET)
+    except Exception:
+        pass  # Sem disco gravável segue-se sem a cópia local
+    
+    return df[[col for col in colunas if col in df.columns]], avisos
 
-        # Converte todas as colunas numéricas de uma vez
-        all_numeric_cols = list(rename_map.keys())
-        for col in all_numeric_cols:
-            if 'NUM' in col or 'VALOR' in col or 'TOTAL' in col or 'REM' in col or 'PERC' in col or 'BONUS' in col or 'PLR' in col or 'DESVIO' in col:
-                 if col in df.columns:
-                    df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
-                 else:
-                    df[col] = 0
-
-        # Limpeza e Padronização de Dados Categóricos
-        categorical_cols = ['NOME_COMPANHIA', 'ORGAO_ADMINISTRACAO', 'SETOR_ATIVIDADE', 'CONTROLE_ACIONARIO', 'UF_SEDE']
-        for col in categorical_cols:
-            if col in df.columns:
-                df[col] = df[col].astype(str).str.strip().str.upper().fillna(f'{col.replace("_", " ").title()} Não Informado')
-            else:
-                st.warning(f"Atenção: A coluna para '{col}' não foi encontrada. Um valor padrão será usado.")
-                df[col] = f"{col.replace('_', ' ').title()} Não Informado"
+@st.cache_data(ttl=MAX_IDADE_PARQUET, max_entries=64)
+def indice_filtros(_df, versao, uf, setor, controle) -> np.ndarray:
+    """Posições das linhas que atendem aos filtros globais, em cache por (versão dos dados, uf, setor, controle)."""
+    mask = np.ones(len(_df), dtype=bool)
+    if uf != "TODAS":
+        mask &= (_df['UF_SEDE'] == uf).to_numpy()
+    if setor != "TODOS":
+        # 4. Use o nome de coluna correto no filtro também
+        mask &= (_df['SETOR_ATIVIDADE'] == setor).to_numpy()
+    if controle != "TODOS":
+        mask &= (_df['CONTROLE_ACIONARIO'] == controle).to_numpy()
+    return np.flatnonzero(mask)
 
-        if 'ANO_REFER' in df.columns:
-            df['ANO_REFER'] = pd.to_numeric(df['ANO_REFER'], errors='coerce').dropna().astype(int)
-        
-        return df
-    except Exception as e:
-        st.error(f"Erro crítico ao carregar ou processar os dados: {e}")
-        return pd.DataFrame()
+@st.cache_data
+def componentes_anuais(_df, chave, colunas: tuple) -> pd.DataFrame:
+    """Soma anual de 'colunas' (e o primeiro nº de membros) por (empresa, órgão, ano), indexada e ordenada.
+    Calculada uma vez por 'chave' (filtros): as seleções de empresa e órgão só recortam dela."""
+    agregacao = {**dict.fromkeys(colunas, 'sum'), 'NUM_MEMBROS_TOTAL': 'first'}
+    return _df.groupby(['NOME_COMPANHIA', 'ORGAO_ADMINISTRACAO', 'ANO_REFER'], observed=True).agg(agregacao).sort_index()
+
+@st.cache_data
+def composicao_por_orgao(_df, chave, empresa, ano, colunas: tuple) -> pd.DataFrame:
+    """Componentes de uma empresa num ano, por órgão (com Total), recortados de componentes_anuais em vez
+    de filtrar e reagrupar o DataFrame a cada seleção. Só ficam os órgãos com Total > 0."""
+    tabela = componentes_anuais(_df, chave, colunas)
+    try:
+        inicio, fim = tabela.index.slice_locs((empresa,), (empresa,))
+    except (KeyError, TypeError):  # valor fora das categorias do índice
+        inicio = fim = 0
+    df_empresa = tabela.iloc[inicio:fim].droplevel(0)
+    df_grouped = df_empresa[df_empresa.index.get_level_values('ANO_REFER') == ano].droplevel('ANO_REFER')[list(colunas)]
+    df_grouped['Total'] = df_grouped.sum(axis=1)
+    return df_grouped[df_grouped['Total'] > 0]
+
+@st.cache_data
+def evolucao_componentes(_df, chave, empresa, orgao, calc_type, component_cols: dict) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Dados anuais de uma empresa/órgão (com Total, por membro se pedido) e o formato longo do gráfico,
+    em cache por seleção: o melt e o mapeamento dos nomes não são refeitos a cada rerun."""
+    colunas = tuple(component_cols.values())
+    tabela = componentes_anuais(_df, chave, colunas)
+    try:
+        inicio, fim = tabela.index.slice_locs((empresa, orgao), (empresa, orgao))
+    except (KeyError, TypeError):  # valor fora das categorias do índice
+        inicio = fim = 0
+    yearly_data = tabela.iloc[inicio:fim].droplevel([0, 1]).reset_index()
+    yearly_data['Total'] = yearly_data[list(colunas)].sum(axis=1)
+    if calc_type == "Média por Membro":
+        yearly_data = yearly_data[yearly_data['NUM_MEMBROS_TOTAL'] > 0]
+        for col in colunas:
+            yearly_data[col] = yearly_data[col] / yearly_data['NUM_MEMBROS_TOTAL']
+        yearly_data['Total'] = yearly_data['Total'] / yearly_data['NUM_MEMBROS_TOTAL']
+    df_plot = yearly_data.melt(id_vars=['ANO_REFER'], value_vars=list(colunas), var_name='Componente', value_name='Valor')
+    df_plot = df_plot[df_plot['Valor'] > 0]
+    df_plot['Componente'] = df_plot['Componente'].map({v: k for k, v in component_cols.items()})
+    return yearly_data, df_plot
 
 def get_default_index(options_list, default_value):
     """Retorna o índice de um valor padrão em uma lista, ou 0 se não for encontrado."""
@@ -117,18 +264,8 @@ def get_default_index(options_list, default_value):
         return 0
 
 def create_download_button(df, filename):
-    """Cria um botão de download para um DataFrame em formato Excel."""
-    output = io.BytesIO()
-    # CORREÇÃO DO ERRO DE DOWNLOAD: Alterado engine para 'openpyxl'
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df.to_excel(writer, index=False, sheet_name='Dados')
-    processed_data = output.getvalue()
-    st.download_button(
-        label="📥 Download dos dados do gráfico (Excel)",
-        data=processed_data,
-        file_name=f"{filename}.xlsx",
-        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-    )
+    """Botão de download em Excel do utils (planilha gerada só no clique), com o rótulo deste app."""
+    utils.create_download_button(df, filename, label="📥 Download dos dados do gráfico (Excel)")
 
 def format_year(year):
     """Adiciona '(projeção)' ao ano de 2025."""
@@ -175,23 +312,26 @@ def page_home():
 
 
 def page_remuneracao_individual(df: pd.DataFrame):
+    # Plotly é importado só nas páginas com gráficos: a página inicial abre sem esse custo
+    import plotly.express as px
     st.header("Análise da Remuneração Individual")
+    chave = st.session_state['chave_filtros']
     
     st.subheader("Evolução Comparativa por Empresa (2022-2024)")
     col1, col2 = st.columns(2)
     with col1:
-        orgaos_disponiveis = sorted(df['ORGAO_ADMINISTRACAO'].unique())
+        orgaos_disponiveis = opcoes_unicas(df, chave, 'ORGAO_ADMINISTRACAO')
         default_index = get_default_index(orgaos_disponiveis, 'DIRETORIA ESTATUTARIA')
         orgao = st.selectbox("1. Selecione o Órgão", orgaos_disponiveis, index=default_index, key='orgao_ind')
-    df_orgao = df[df['ORGAO_ADMINISTRACAO'] == orgao]
     with col2:
-        empresas_disponiveis = sorted(df_orgao['NOME_COMPANHIA'].unique())
+        # Em cache por (filtros, órgão): o recorte do órgão só é feito na primeira vez
+        empresas_disponiveis = opcoes_do_recorte(df, chave, 'ORGAO_ADMINISTRACAO', orgao, 'NOME_COMPANHIA')
         if not empresas_disponiveis:
             st.warning("Nenhuma empresa encontrada para o órgão selecionado.")
             st.stop()
         empresa = st.selectbox("2. Selecione a Empresa", empresas_disponiveis, key='empresa_ind')
 
-    df_filtered = df_orgao[(df_orgao['NOME_COMPANHIA'] == empresa) & (df_orgao['ANO_REFER'].isin([2022, 2023, 2024]))]
+    df_filtered = df[(df['ORGAO_ADMINISTRACAO'] == orgao) & (df['NOME_COMPANHIA'] == empresa) & (df['ANO_REFER'].isin([2022, 2023, 2024]))]
     if not df_filtered.empty:
         df_analysis = df_filtered[['ANO_REFER', 'REM_MAXIMA_INDIVIDUAL', 'REM_MEDIA_INDIVIDUAL', 'REM_MINIMA_INDIVIDUAL']]
         df_plot = df_analysis.melt(id_vars=['ANO_REFER'], value_vars=['REM_MAXIMA_INDIVIDUAL', 'REM_MEDIA_INDIVIDUAL', 'REM_MINIMA_INDIVIDUAL'], var_name='Métrica', value_name='Valor')
@@ -212,24 +352,30 @@ def page_remuneracao_individual(df: pd.DataFrame):
     st.subheader("Ranking de Empresas por Remuneração Individual")
     col_bar1, col_bar2 = st.columns(2)
     with col_bar1:
-        ano_bar = st.selectbox("Selecione o Ano para o Ranking", sorted(df['ANO_REFER'].unique(), reverse=True), key='ano_bar')
+        ano_bar = st.selectbox("Selecione o Ano para o Ranking", opcoes_unicas(df, chave, 'ANO_REFER', reverse=True), key='ano_bar')
     with col_bar2:
         metric_options = {'Máxima': 'REM_MAXIMA_INDIVIDUAL', 'Média': 'REM_MEDIA_INDIVIDUAL', 'Mínima': 'REM_MINIMA_INDIVIDUAL'}
         metrica_selecionada = st.selectbox("Selecione a Métrica", list(metric_options.keys()), key='metrica_bar')
-    df_bar = df[(df['ANO_REFER'] == ano_bar) & (df['ORGAO_ADMINISTRACAO'] == orgao)]
+    # Cada análise carrega só as suas colunas: o índice por (ano, órgão) é guardado por análise
+    df_bar = recortar_ano(indexar_por_ano(df, (chave, 'individual')), ano_bar, orgao)
     coluna_metrica = metric_options[metrica_selecionada]
     df_bar = df_bar[df_bar[coluna_metrica] > 0]
-    df_top_companies = df_bar.nlargest(15, coluna_metrica)
+    df_top_companies = maiores_valores(df_bar, coluna_metrica, 15)
     if not df_top_companies.empty:
-        fig_bar = px.bar(df_top_companies.sort_values(by=coluna_metrica), x=coluna_metrica, y='NOME_COMPANHIA', orientation='h', text_auto='.2s', title=f"Top 15 Empresas por Remuneração {metrica_selecionada} ({orgao}, {format_year(ano_bar)})", labels={coluna_metrica: f"Remuneração {metrica_selecionada} (R$)", 'NOME_COMPANHIA': 'Empresa'})
-        fig_bar.update_layout(yaxis={'categoryorder':'total ascending'})
+        fig_bar = figura_ranking(df_top_companies, (chave, ano_bar, orgao, coluna_metrica), coluna_metrica,
+                                 f"Top 15 Empresas por Remuneração {metrica_selecionada} ({orgao}, {format_year(ano_bar)})",
+                                 labels={coluna_metrica: f"Remuneração {metrica_selecionada} (R$)", 'NOME_COMPANHIA': 'Empresa'},
+                                 separators=None)  # este app usa os separadores padrão do Plotly
         st.plotly_chart(fig_bar, use_container_width=True)
         create_download_button(df_top_companies[['NOME_COMPANHIA', coluna_metrica]], f"ranking_rem_individual_{ano_bar}")
     else:
         st.warning(f"Não há dados de Remuneração {metrica_selecionada} para exibir para os filtros selecionados.")
 
 def page_componentes_remuneracao(df: pd.DataFrame):
+    import plotly.express as px
+    import plotly.graph_objects as go
     st.header("Análise dos Componentes da Remuneração Total")
+    chave = st.session_state['chave_filtros']
     analysis_type = st.selectbox("Escolha o tipo de análise:", ["Composição por Empresa (Ano Único)", "Evolução Anual Comparativa (por Empresa)", "Ranking de Empresas (Top 15)"], key="component_analysis_type")
     component_cols = {'Salário': 'REM_FIXA_SALARIO', 'Benefícios': 'REM_FIXA_BENEFICIOS', 'Comitês': 'REM_FIXA_COMITES', 'Bônus': 'REM_VAR_BONUS', 'PLR': 'REM_VAR_PLR', 'Comissões': 'REM_VAR_COMISSOES', 'Pós-Emprego': 'REM_POS_EMPREGO', 'Cessação': 'REM_CESSACAO_CARGO', 'Ações': 'REM_ACOES_BLOCO3', 'Outros': 'REM_FIXA_OUTROS'}
 
@@ -237,14 +383,11 @@ def page_componentes_remuneracao(df: pd.DataFrame):
         st.subheader("Composição da Remuneração por Órgão")
         col1, col2 = st.columns(2)
         with col1:
-            empresa = st.selectbox("1. Selecione a Empresa", sorted(df['NOME_COMPANHIA'].unique()), key='empresa_comp_1')
+            empresa = st.selectbox("1. Selecione a Empresa", opcoes_unicas(df, chave, 'NOME_COMPANHIA'), key='empresa_comp_1')
         df_empresa = df[df['NOME_COMPANHIA'] == empresa]
         with col2:
-            ano = st.selectbox("2. Selecione o Ano", sorted(df_empresa['ANO_REFER'].unique(), reverse=True), key='ano_comp_1')
-        df_filtered = df_empresa[df_empresa['ANO_REFER'] == ano]
-        df_grouped = df_filtered.groupby('ORGAO_ADMINISTRACAO')[[col for col in component_cols.values() if col in df_filtered.columns]].sum()
-        df_grouped['Total'] = df_grouped.sum(axis=1)
-        df_grouped = df_grouped[df_grouped['Total'] > 0]
+            ano = st.selectbox("2. Selecione o Ano", opcoes_unicas(df_empresa, (chave, empresa), 'ANO_REFER', reverse=True), key='ano_comp_1')
+        df_grouped = composicao_por_orgao(df, chave, empresa, ano, tuple(component_cols.values()))
         if not df_grouped.empty:
             df_plot = df_grouped.drop(columns='Total').reset_index().melt(id_vars='ORGAO_ADMINISTRACAO', var_name='Componente', value_name='Valor')
             df_plot = df_plot[df_plot['Valor'] > 0]
@@ -262,26 +405,15 @@ def page_componentes_remuneracao(df: pd.DataFrame):
         st.subheader("Evolução Anual dos Componentes")
         col1, col2, col3 = st.columns(3)
         with col1:
-            empresa = st.selectbox("1. Selecione a Empresa", sorted(df['NOME_COMPANHIA'].unique()), key='empresa_comp_2')
+            empresa = st.selectbox("1. Selecione a Empresa", opcoes_unicas(df, chave, 'NOME_COMPANHIA'), key='empresa_comp_2')
         df_empresa = df[df['NOME_COMPANHIA'] == empresa]
         with col2:
-            orgaos_disponiveis = sorted(df_empresa['ORGAO_ADMINISTRACAO'].unique())
+            orgaos_disponiveis = opcoes_unicas(df_empresa, (chave, empresa), 'ORGAO_ADMINISTRACAO')
             default_index = get_default_index(orgaos_disponiveis, 'DIRETORIA ESTATUTARIA')
             orgao = st.selectbox("2. Selecione o Órgão", orgaos_disponiveis, index=default_index, key='orgao_comp_2')
         with col3:
             calc_type = st.radio("Calcular por:", ["Total", "Média por Membro"], key='calc_type_2', horizontal=True)
-        df_filtered = df_empresa[df_empresa['ORGAO_ADMINISTRACAO'] == orgao]
-        yearly_data = df_filtered.groupby('ANO_REFER').agg({**{col: 'sum' for col in component_cols.values() if col in df.columns}, 'NUM_MEMBROS_TOTAL': 'first'}).reset_index()
-        yearly_data['Total'] = yearly_data[[col for col in component_cols.values() if col in yearly_data.columns]].sum(axis=1)
-        if calc_type == "Média por Membro":
-            yearly_data = yearly_data[yearly_data['NUM_MEMBROS_TOTAL'] > 0]
-            for col in component_cols.values():
-                if col in yearly_data.columns:
-                    yearly_data[col] = yearly_data[col] / yearly_data['NUM_MEMBROS_TOTAL']
-            yearly_data['Total'] = yearly_data['Total'] / yearly_data['NUM_MEMBROS_TOTAL']
-        df_plot = yearly_data.melt(id_vars=['ANO_REFER'], value_vars=[col for col in component_cols.values() if col in yearly_data.columns], var_name='Componente', value_name='Valor')
-        df_plot = df_plot[df_plot['Valor'] > 0]
-        df_plot['Componente'] = df_plot['Componente'].map({v: k for k, v in component_cols.items()})
+        yearly_data, df_plot = evolucao_componentes(df, chave, empresa, orgao, calc_type, component_cols)
         if not df_plot.empty:
             yearly_data['ANO_REFER_FORMATTED'] = yearly_data['ANO_REFER'].apply(format_year)
             df_plot = pd.merge(df_plot, yearly_data[['ANO_REFER', 'ANO_REFER_FORMATTED']], on='ANO_REFER')
@@ -303,9 +435,9 @@ def page_componentes_remuneracao(df: pd.DataFrame):
         st.subheader("Ranking de Empresas por Componente de Remuneração")
         col1, col2, col3 = st.columns(3)
         with col1:
-            ano = st.selectbox("1. Selecione o Ano", sorted(df['ANO_REFER'].unique(), reverse=True), key='ano_comp_3')
+            ano = st.selectbox("1. Selecione o Ano", opcoes_unicas(df, chave, 'ANO_REFER', reverse=True), key='ano_comp_3')
         with col2:
-            orgaos_disponiveis = sorted(df['ORGAO_ADMINISTRACAO'].unique())
+            orgaos_disponiveis = opcoes_unicas(df, chave, 'ORGAO_ADMINISTRACAO')
             default_index = get_default_index(orgaos_disponiveis, 'DIRETORIA ESTATUTARIA')
             orgao = st.selectbox("2. Selecione o Órgão", orgaos_disponiveis, index=default_index, key='orgao_comp_3')
         rank_options = {'Remuneração Total': 'TOTAL_REMUNERACAO_ORGAO', **component_cols}
@@ -313,31 +445,29 @@ def page_componentes_remuneracao(df: pd.DataFrame):
             rank_metric_name = st.selectbox("3. Rankear por:", list(rank_options.keys()), key='rank_metric_3')
         col_rank = rank_options[rank_metric_name]
         calc_type = st.radio("Calcular por:", ["Total", "Média por Membro"], key='calc_type_3', horizontal=True)
-        df_filtered = df[(df['ANO_REFER'] == ano) & (df['ORGAO_ADMINISTRACAO'] == orgao)]
-        if calc_type == "Total":
-            df_rank = df_filtered.groupby('NOME_COMPANHIA')[col_rank].sum().nlargest(15).reset_index()
-        else: # Média por Membro
-            df_agg = df_filtered.groupby('NOME_COMPANHIA').agg(Valor=(col_rank, 'sum'), Membros=('NUM_MEMBROS_TOTAL', 'first')).reset_index()
-            df_agg = df_agg[df_agg['Membros'] > 0]
-            df_agg[col_rank] = df_agg['Valor'] / df_agg['Membros']
-            df_rank = df_agg.nlargest(15, col_rank)
+        # Recorte da tabela de fatos (ano, órgão, empresa) em cache; o DataFrame de cada análise tem só as
+        # suas colunas, por isso a chave leva também a análise
+        df_rank = ranking_empresas(df, (chave, 'componentes'), ano, orgao, col_rank, 'NUM_MEMBROS_TOTAL', calc_type)
         if not df_rank.empty and df_rank[col_rank].sum() > 0:
-            fig = px.bar(df_rank.sort_values(by=col_rank), x=col_rank, y='NOME_COMPANHIA', orientation='h', text_auto='.2s', title=f"Top 15 Empresas por {rank_metric_name} ({calc_type}) em {format_year(ano)}")
-            fig.update_layout(yaxis={'categoryorder':'total ascending'}, xaxis_title=f"Valor {calc_type} (R$)", yaxis_title="Empresa")
+            fig = figura_ranking(df_rank, (chave, ano, orgao, col_rank, calc_type), col_rank,
+                                 f"Top 15 Empresas por {rank_metric_name} ({calc_type}) em {format_year(ano)}",
+                                 xaxis_title=f"Valor {calc_type} (R$)", yaxis_title="Empresa", separators=None)
             st.plotly_chart(fig, use_container_width=True)
             create_download_button(df_rank, f"ranking_componentes_{ano}_{orgao}")
         else:
             st.info("Não há dados para gerar o ranking para a seleção atual.")
 
 def page_bonus_plr(df: pd.DataFrame):
+    import plotly.express as px
     st.header("Análise Detalhada de Bônus e Participação nos Resultados")
+    chave = st.session_state['chave_filtros']
     st.subheader("Evolução Comparativa de Bônus e PLR")
     col1, col2, col3 = st.columns(3)
     with col1:
-        empresa = st.selectbox("1. Selecione a Empresa", sorted(df['NOME_COMPANHIA'].unique()), key='empresa_bonus_1')
+        empresa = st.selectbox("1. Selecione a Empresa", opcoes_unicas(df, chave, 'NOME_COMPANHIA'), key='empresa_bonus_1')
     df_empresa = df[df['NOME_COMPANHIA'] == empresa]
     with col2:
-        orgaos_disponiveis = sorted(df_empresa['ORGAO_ADMINISTRACAO'].unique())
+        orgaos_disponiveis = opcoes_unicas(df_empresa, (chave, empresa), 'ORGAO_ADMINISTRACAO')
         default_index = get_default_index(orgaos_disponiveis, 'DIRETORIA ESTATUTARIA')
         orgao = st.selectbox("2. Selecione o Órgão", orgaos_disponiveis, index=default_index, key='orgao_bonus_1')
     with col3:
@@ -345,15 +475,15 @@ def page_bonus_plr(df: pd.DataFrame):
 
     df_filtered = df_empresa[df_empresa['ORGAO_ADMINISTRACAO'] == orgao]
     bonus_cols = {'Bônus Mínimo': 'BONUS_MIN', 'Bônus Alvo': 'BONUS_ALVO', 'Bônus Máximo': 'BONUS_MAX', 'Bônus Pago': 'BONUS_PAGO', 'PLR Mínimo': 'PLR_MIN', 'PLR Alvo': 'PLR_ALVO', 'PLR Máximo': 'PLR_MAX', 'PLR Pago': 'PLR_PAGO'}
-    yearly_data = df_filtered.groupby('ANO_REFER').agg({**{col: 'sum' for col in bonus_cols.values() if col in df.columns}, 'NUM_MEMBROS_BONUS_PLR': 'first'}).reset_index()
+    # O load_data garante todas as colunas numéricas (ausentes entram zeradas), então a lista é fixa
+    colunas_bonus = list(bonus_cols.values())
+    yearly_data = df_filtered.groupby('ANO_REFER').agg({**dict.fromkeys(colunas_bonus, 'sum'), 'NUM_MEMBROS_BONUS_PLR': 'first'}).reset_index()
 
     if calc_type == "Média por Membro":
         yearly_data = yearly_data[yearly_data['NUM_MEMBROS_BONUS_PLR'] > 0]
-        for col in bonus_cols.values():
-            if col in yearly_data.columns:
-                yearly_data[col] = yearly_data[col] / yearly_data['NUM_MEMBROS_BONUS_PLR']
+        yearly_data[colunas_bonus] = yearly_data[colunas_bonus].div(yearly_data['NUM_MEMBROS_BONUS_PLR'], axis=0)
 
-    df_plot = yearly_data.melt(id_vars=['ANO_REFER'], value_vars=[col for col in bonus_cols.values() if col in yearly_data.columns], var_name='Métrica', value_name='Valor')
+    df_plot = yearly_data.melt(id_vars=['ANO_REFER'], value_vars=colunas_bonus, var_name='Métrica', value_name='Valor')
     df_plot = df_plot[df_plot['Valor'] > 0]
     df_plot['Tipo'] = df_plot['Métrica'].apply(lambda x: 'Bônus' if 'BONUS' in x else 'PLR')
     df_plot['Métrica'] = df_plot['Métrica'].map({v: k for k, v in bonus_cols.items()})
@@ -436,24 +566,19 @@ def page_bonus_plr(df: pd.DataFrame):
     st.subheader("Ranking de Empresas por Bônus/PLR")
     col_rank1, col_rank2, col_rank3 = st.columns(3)
     with col_rank1:
-        ano_rank = st.selectbox("1. Selecione o Ano", sorted(df['ANO_REFER'].unique(), reverse=True), key='ano_bonus_rank')
+        ano_rank = st.selectbox("1. Selecione o Ano", opcoes_unicas(df, chave, 'ANO_REFER', reverse=True), key='ano_bonus_rank')
     with col_rank2:
         rank_metric_name = st.selectbox("2. Rankear por:", list(bonus_cols.keys()), key='metric_bonus_rank')
     with col_rank3:
         calc_type_rank = st.radio("Calcular por:", ["Total", "Média por Membro"], key='calc_type_bonus_rank', horizontal=True)
     col_rank = bonus_cols[rank_metric_name]
-    df_rank_filtered = df[df['ANO_REFER'] == ano_rank]
-    if calc_type_rank == "Total":
-        df_rank = df_rank_filtered.groupby('NOME_COMPANHIA')[col_rank].sum().nlargest(15).reset_index()
-    else: # Média
-        df_agg = df_rank_filtered.groupby('NOME_COMPANHIA').agg(Valor=(col_rank, 'sum'), Membros=('NUM_MEMBROS_BONUS_PLR', 'first')).reset_index()
-        df_agg = df_agg[df_agg['Membros'] > 0]
-        df_agg[col_rank] = df_agg['Valor'] / df_agg['Membros']
-        df_rank = df_agg.nlargest(15, col_rank)
+    # Todos os órgãos do ano: recorte da tabela de fatos (ano, empresa) em cache
+    df_rank = ranking_empresas(df, (chave, 'bonus'), ano_rank, None, col_rank, 'NUM_MEMBROS_BONUS_PLR', calc_type_rank)
     if not df_rank.empty and df_rank[col_rank].sum() > 0:
-        fig_rank = px.bar(df_rank.sort_values(by=col_rank), x=col_rank, y='NOME_COMPANHIA', orientation='h', text_auto='.2s', title=f"Top 15 Empresas por {rank_metric_name} ({calc_type_rank}) em {format_year(ano_rank)}",
-                         template="streamlit") # Adicionado para melhor integração
-        fig_rank.update_layout(yaxis={'categoryorder':'total ascending'}, xaxis_title=f"Valor {calc_type_rank} (R$)", yaxis_title="Empresa")
+        fig_rank = figura_ranking(df_rank, (chave, ano_rank, col_rank, calc_type_rank), col_rank,
+                                  f"Top 15 Empresas por {rank_metric_name} ({calc_type_rank}) em {format_year(ano_rank)}",
+                                  template="streamlit",  # Adicionado para melhor integração
+                                  xaxis_title=f"Valor {calc_type_rank} (R$)", yaxis_title="Empresa", separators=None)
         st.plotly_chart(fig_rank, use_container_width=True)
         create_download_button(df_rank, f"ranking_bonus_plr_{ano_rank}")
     else:
@@ -461,15 +586,16 @@ def page_bonus_plr(df: pd.DataFrame):
         
 def page_estatisticas_quartis(df: pd.DataFrame):
     st.header("Análise Estatística por Quartis")
+    chave = st.session_state['chave_filtros']
     metric_options = {
         'Remuneração Máxima': 'REM_MAXIMA_INDIVIDUAL', 'Remuneração Média': 'REM_MEDIA_INDIVIDUAL', 'Remuneração Mínima': 'REM_MINIMA_INDIVIDUAL',
         'Remuneração Total do Órgão': 'TOTAL_REMUNERACAO_ORGAO', 'Salário': 'REM_FIXA_SALARIO', 'Bônus Pago': 'BONUS_PAGO'
     }
     col1, col2, col3 = st.columns(3)
     with col1:
-        ano = st.selectbox("1. Selecione o Ano", sorted(df['ANO_REFER'].unique(), reverse=True), key='ano_quartil')
+        ano = st.selectbox("1. Selecione o Ano", opcoes_unicas(df, chave, 'ANO_REFER', reverse=True), key='ano_quartil')
     with col2:
-        orgaos_disponiveis = sorted(df['ORGAO_ADMINISTRACAO'].unique())
+        orgaos_disponiveis = opcoes_unicas(df, chave, 'ORGAO_ADMINISTRACAO')
         default_index = get_default_index(orgaos_disponiveis, 'DIRETORIA ESTATUTARIA')
         orgao = st.selectbox("2. Selecione o Órgão", orgaos_disponiveis, index=default_index, key='orgao_quartil')
     with col3:
@@ -478,7 +604,7 @@ def page_estatisticas_quartis(df: pd.DataFrame):
     calc_type = st.radio("Calcular por:", ["Total", "Média por Membro"], key='calc_type_quartil', horizontal=True)
     
     col_metrica = metric_options[metrica]
-    df_filtered = df[(df['ANO_REFER'] == ano) & (df['ORGAO_ADMINISTRACAO'] == orgao)]
+    df_filtered = recortar_ano(indexar_por_ano(df, (chave, 'quartis')), ano, orgao)
     
     # Define a coluna de membros correta para o cálculo da média
     if metrica in ['Bônus Pago']:
@@ -489,15 +615,16 @@ def page_estatisticas_quartis(df: pd.DataFrame):
         membros_col = 'NUM_MEMBROS_TOTAL'
         
     if calc_type == "Média por Membro":
-        df_filtered = df_filtered[df_filtered[membros_col] > 0].copy()
-        df_filtered.loc[:, col_metrica] = df_filtered[col_metrica] / df_filtered[membros_col]
+        # assign troca só a coluna da métrica num novo DataFrame, sem copiar o recorte inteiro
+        df_filtered = df_filtered[df_filtered[membros_col] > 0]
+        df_filtered = df_filtered.assign(**{col_metrica: df_filtered[col_metrica] / df_filtered[membros_col]})
     
     df_filtered = df_filtered[df_filtered[col_metrica] > 0]
     
     if not df_filtered.empty:
         # CORREÇÃO: Use 'SETOR_ATIVIDADE' em vez de 'SETOR_'
         st.subheader(f"Estatísticas por Setor de Atividade ({format_year(ano)})")
-        df_stats_sector = df_filtered.groupby('SETOR_ATIVIDADE')[col_metrica].describe().reset_index()
+        df_stats_sector = df_filtered.groupby('SETOR_ATIVIDADE', observed=True)[col_metrica].describe().reset_index()
         df_stats_sector = df_stats_sector.rename(columns={'count': 'Nº de Companhias', 'mean': 'Média', 'std': 'Desvio Padrão', 'min': 'Mínimo', '25%': '1º Quartil', '50%': 'Mediana (2º Q)', '75%': '3º Quartil', 'max': 'Máximo'})
         st.dataframe(df_stats_sector.style.format({'Nº de Companhias': '{:,.0f}', 'Média': 'R$ {:,.2f}', 'Desvio Padrão': 'R$ {:,.2f}', 'Mínimo': 'R$ {:,.2f}', '1º Quartil': 'R$ {:,.2f}', 'Mediana (2º Q)': 'R$ {:,.2f}', '3º Quartil': 'R$ {:,.2f}', 'Máximo': 'R$ {:,.2f}'}))
         create_download_button(df_stats_sector, f"estatisticas_setor_{ano}_{orgao}")
@@ -514,42 +641,50 @@ def page_estatisticas_quartis(df: pd.DataFrame):
 # --- Função Principal da Aplicação ---
 def main():
     github_url = "https://raw.githubusercontent.com/tovarich86/pesq_rem_CVM/main/dados_cvm_mesclados.csv"
+    # A análise escolhida (rádio da barra lateral, da execução anterior) define as colunas carregadas
+    pagina_selecionada = st.session_state.get('pagina_selecionada', "Página Inicial")
+    colunas = colunas_da_pagina(pagina_selecionada)
+
+    st.sidebar.title("Painel de Análise")
+    st.sidebar.header("Filtros Globais")
+
     # 1. Carregue os dados USANDO APENAS a sua função de processamento.
-    df_original = load_data(github_url)
+    try:
+        df_original, avisos = load_data(github_url, colunas)
+    except Exception as e:
+        st.error(f"Erro crítico ao carregar ou processar os dados: {e}")
+        st.stop()
 
-    
+    # Avisos da carga: exibidos uma vez por sessão, já que a função em cache não os repete
+    if not st.session_state.get('avisos_carga_exibidos'):
+        for aviso in avisos:
+            st.sidebar.info(aviso)
+        st.session_state['avisos_carga_exibidos'] = True
 
     if df_original.empty:
         st.error("Falha no carregamento dos dados. O aplicativo não pode continuar.")
         st.stop()
 
-    st.sidebar.title("Painel de Análise")
-    st.sidebar.header("Filtros Globais")
-
-    # Use as colunas padronizadas pela função load_data
-    ufs_disponiveis = ["TODAS"] + sorted(df_original['UF_SEDE'].unique())
+    # Use as colunas padronizadas pela função load_data; as opções acompanham a versão dos dados
+    versao = df_original.attrs['versao']
+    ufs_disponiveis = ["TODAS"] + opcoes_unicas(df_original, versao, 'UF_SEDE')
     uf = st.sidebar.selectbox("UF da Sede", ufs_disponiveis)
 
     # 3. CORRIJA o nome da coluna de setor para ser consistente com load_data
-    setores_disponiveis = ["TODOS"] + sorted(df_original['SETOR_ATIVIDADE'].unique())
+    setores_disponiveis = ["TODOS"] + opcoes_unicas(df_original, versao, 'SETOR_ATIVIDADE')
     setor = st.sidebar.selectbox("Setor de Atividade", setores_disponiveis) # Nome do filtro atualizado para clareza
     
-    controles_disponiveis = ["TODOS"] + sorted(df_original['CONTROLE_ACIONARIO'].unique())
+    controles_disponiveis = ["TODOS"] + opcoes_unicas(df_original, versao, 'CONTROLE_ACIONARIO')
     controle = st.sidebar.selectbox("Controle Acionário", controles_disponiveis)
 
-    df_filtrado = df_original.copy()
-    if uf != "TODAS":
-        df_filtrado = df_filtrado[df_filtrado['UF_SEDE'] == uf]
-    if setor != "TODOS":
-        # 4. Use o nome de coluna correto no filtro também
-        df_filtrado = df_filtrado[df_filtrado['SETOR_ATIVIDADE'] == setor]
-    if controle != "TODOS":
-        df_filtrado = df_filtrado[df_filtrado['CONTROLE_ACIONARIO'] == controle]
+    # Identifica df_filtrado nos caches das páginas: a versão dos dados muda a cada recarga com conteúdo novo
+    chave_filtros = (versao, uf, setor, controle)
+    posicoes = indice_filtros(df_original, *chave_filtros)
+    # Sem filtro ativo não há o que recortar: as páginas só leem o DataFrame, então ele é usado direto
+    df_filtrado = df_original if len(posicoes) == len(df_original) else df_original.take(posicoes)
+    st.session_state['chave_filtros'] = chave_filtros
 
-    pagina_selecionada = st.sidebar.radio(
-        "Selecione a Análise:",
-        ["Página Inicial", "Remuneração Individual (Máx/Média/Mín)", "Componentes da Remuneração Total", "Bônus e PLR", "Análise Estatística (Quartis)"]
-    )
+    pagina_selecionada = st.sidebar.radio("Selecione a Análise:", list(COLUNAS_POR_PAGINA), key='pagina_selecionada')
 
     if df_filtrado.empty:
         st.warning("Nenhum dado encontrado para os filtros globais selecionados. Por favor, ajuste os filtros na barra lateral.")
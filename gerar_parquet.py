@@ -0,0 +1,28 @@
+"""
+Gera o artefato Parquet publicado ao lado do CSV (dados_cvm_mesclados.parquet), com as colunas e os
+tipos já tratados por processar_csv e o sha256 do CSV de origem. O app só o usa enquanto o CSV publicado
+for esse mesmo; executar sempre que o CSV for atualizado e publicar os dois arquivos juntos:
+
+    python gerar_parquet.py [caminho_do_csv]
+"""
+import hashlib
+import sys
+from pathlib import Path
+
+from home import FORMATO_SNAPSHOT, processar_csv
+
+
+def main(caminho_csv: str = 'dados_cvm_mesclados.csv'):
+    csv = Path(caminho_csv)
+    raw = csv.read_bytes()
+    df = processar_csv(raw)
+    # O app só aceita artefatos no formato atual do tratamento e gerados a partir do CSV publicado
+    df.attrs['formato'] = FORMATO_SNAPSHOT
+    df.attrs['csv_sha256'] = hashlib.sha256(raw).hexdigest()
+    destino = csv.with_suffix('.parquet')
+    df.to_parquet(destino, compression='zstd', index=False)
+    print(f"{destino}: {len(df)} linhas, {len(df.columns)} colunas")
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
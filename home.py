@@ -1,7 +1,14 @@
 import streamlit as st
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
 import io
+import time
+import tempfile
+import hashlib
 import warnings
+from pathlib import Path
+from utils import MAX_IDADE_SNAPSHOT, baixar_csv, gravar_parquet
 
 warnings.simplefilter(action='ignore', category=FutureWarning)
 
@@ -9,29 +16,145 @@ warnings.simplefilter(action='ignore', category=FutureWarning)
 # Esta configuração deve ser a primeira linha executada no Streamlit
 st.set_page_config(layout="wide", page_title="Análise CVM", page_icon="📊")
 
+# --- Colunas Utilizadas pelas Páginas ---
+# Apenas estas colunas são lidas do CSV. Os campos de texto livre do FRE (Observacao,
+# Descricao_Outros_*) e os metadados do documento não são usados em nenhuma análise.
+COLUNAS_UTILIZADAS = [
+    # Identificação e Filtros Globais
+    'CNPJ_Companhia', 'NOME_COMPANHIA', 'ANO_REFER', 'ORGAO_ADMINISTRACAO',
+    'SETOR_ATIVIDADE', 'CONTROLE_ACIONARIO', 'UF_SEDE',
+    # Porte da Companhia (Modelo Preditivo)
+    'FATURAMENTO_BRUTO', 'TOTAL_FUNCIONARIOS',
+    # Componentes da Remuneração Total (item 8.2)
+    'NUM_MEMBROS_TOTAL', 'TOTAL_REMUNERACAO_ORGAO',
+    'REM_FIXA_SALARIO', 'REM_FIXA_BENEFICIOS', 'REM_FIXA_COMITES', 'REM_FIXA_OUTROS',
+    'REM_VAR_BONUS', 'REM_VAR_PLR', 'REM_VAR_REUNIOES', 'REM_VAR_OUTROS', 'REM_VAR_COMISSOES',
+    'REM_POS_EMPREGO', 'REM_CESSACAO_CARGO', 'REM_ACOES_BLOCO3',
+    # Remuneração Individual (item 8.15)
+    'NUM_MEMBROS_INDIVIDUAL', 'REM_MAXIMA_INDIVIDUAL', 'REM_MINIMA_INDIVIDUAL', 'REM_MEDIA_INDIVIDUAL',
+    # Bônus e PLR (item 8.3)
+    'NUM_MEMBROS_BONUS_PLR', 'BONUS_MIN', 'BONUS_MAX', 'BONUS_ALVO', 'BONUS_PAGO',
+    'PLR_MIN', 'PLR_MAX', 'PLR_ALVO', 'PLR_PAGO',
+]
+
+# Colunas numéricas identificadas pelas palavras-chave do nome (calculadas uma única vez)
+PALAVRAS_NUMERICAS = ('NUM', 'VALOR', 'TOTAL', 'REM', 'PERC', 'BONUS', 'PLR', 'DESVIO')
+COLUNAS_NUMERICAS = [col for col in COLUNAS_UTILIZADAS if any(p in col for p in PALAVRAS_NUMERICAS)]
+
 # --- Funções Compartilhadas e Carregamento ---
-@st.cache_data
-def load_data(url: str) -> pd.DataFrame:
+def ler_csv(raw: bytes) -> pd.DataFrame:
+    """Lê o CSV com o leitor multithread do PyArrow, recorrendo ao motor C se ele falhar."""
     try:
-        df = pd.read_csv(url, sep=',', encoding='utf-8-sig', engine='python')
-        df.columns = df.columns.str.strip()
+        return pd.read_csv(io.BytesIO(raw), sep=',', encoding='utf-8-sig', engine='pyarrow', usecols=COLUNAS_UTILIZADAS)
+    except Exception:
+        # O motor C aceita um filtro por função, tolerando espaços extras no cabeçalho
+        colunas = set(COLUNAS_UTILIZADAS)
+        return pd.read_csv(io.BytesIO(raw), sep=',', encoding='utf-8-sig', engine='c', low_memory=False,
+                           usecols=lambda col: col.strip() in colunas)
 
-        colunas_numericas = [col for col in df.columns if 'NUM' in col or 'VALOR' in col or 'TOTAL' in col or 'REM' in col or 'PERC' in col or 'BONUS' in col or 'PLR' in col or 'DESVIO' in col]
-        for col in colunas_numericas:
-             df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
+# Cópia local do DataFrame já tratado, em Parquet: evita baixar e interpretar o CSV a cada reinício
+# do container. É renovada após MAX_IDADE_SNAPSHOT segundos (definido em utils, junto dos caches
+# derivados) para acompanhar as atualizações da base.
+# Incrementar sempre que o tratamento dos tipos em processar_csv mudar, descartando snapshots e artefatos antigos
+FORMATO_SNAPSHOT = 2
 
-        categorical_cols = ['NOME_COMPANHIA', 'ORGAO_ADMINISTRACAO', 'SETOR_ATIVIDADE', 'CONTROLE_ACIONARIO', 'UF_SEDE']
-        for col in categorical_cols:
-            if col in df.columns:
-                df[col] = df[col].astype(str).str.strip().str.upper().fillna(f'{col.replace("_", " ").title()} Não Informado')
+def caminho_snapshot(url: str) -> Path:
+    """Caminho do snapshot Parquet correspondente a uma URL."""
+    chave = hashlib.md5(f"{url}|{FORMATO_SNAPSHOT}".encode()).hexdigest()[:12]
+    return Path(tempfile.gettempdir()) / f"cvm_{chave}.parquet"
 
-        if 'ANO_REFER' in df.columns:
-            df['ANO_REFER'] = pd.to_numeric(df['ANO_REFER'], errors='coerce').dropna().astype(int)
-        
-        return df
-    except Exception as e:
-        st.error(f"Erro crítico ao carregar ou processar os dados: {e}")
-        return pd.DataFrame()
+# Artefato Parquet publicado ao lado do CSV (gerado por gerar_parquet.py), já com o tratamento de
+# processar_csv: na carga a frio o CSV não é interpretado. O artefato guarda o sha256 do CSV de origem
+# e só vale para esse conteúdo: um CSV republicado sem regerar o Parquet é lido diretamente.
+def ler_artefato(url: str, raw: bytes) -> pd.DataFrame | None:
+    """DataFrame do artefato Parquet da URL do CSV, ou None se não houver um no formato atual e gerado
+    a partir do conteúdo 'raw' do CSV."""
+    if not url.endswith('.csv'):
+        return None
+    try:
+        df = pd.read_parquet(io.BytesIO(baixar_csv(url.removesuffix('.csv') + '.parquet')))
+    except Exception:
+        return None  # Artefato ainda não publicado (ou ilegível): segue-se pelo CSV
+    if df.attrs.get('formato') != FORMATO_SNAPSHOT or df.attrs.get('csv_sha256') != hashlib.sha256(raw).hexdigest():
+        return None
+    return df
+
+# Em cache pelo conteúdo dos bytes (não pela URL): mudanças no restante do código
+# não obrigam a interpretar de novo um CSV que não mudou. Só a versão mais recente fica guardada:
+# o load_data mantém a sua própria cópia, e as anteriores seriam memória desperdiçada.
+@st.cache_data(ttl=MAX_IDADE_SNAPSHOT, max_entries=1, show_spinner=False)
+def processar_csv(raw: bytes) -> pd.DataFrame:
+    """Lê o CSV e aplica a limpeza de tipos (numéricos, categóricas e ano)."""
+    df = ler_csv(raw)
+    df.columns = df.columns.str.strip()
+
+    # Converte todas as colunas numéricas numa única passagem
+    colunas_numericas = [col for col in COLUNAS_NUMERICAS if col in df.columns]
+    df[colunas_numericas] = df[colunas_numericas].apply(pd.to_numeric, errors='coerce').fillna(0)
+    # Colunas numéricas ausentes no arquivo entram zeradas: as páginas contam com todas elas
+    ausentes = [col for col in COLUNAS_NUMERICAS if col not in df.columns]
+    df[ausentes] = 0.0
+
+    categorical_cols = ['NOME_COMPANHIA', 'ORGAO_ADMINISTRACAO', 'SETOR_ATIVIDADE', 'CONTROLE_ACIONARIO', 'UF_SEDE']
+    for col in categorical_cols:
+        if col in df.columns:
+            # strip/upper com os kernels do PyArrow, direto sobre os buffers UTF-8; nulos recebem o rótulo padrão
+            texto = pc.utf8_upper(pc.utf8_trim_whitespace(pa.array(df[col].astype('string[pyarrow]'))))
+            df[col] = pc.fill_null(texto, f'{col.replace("_", " ").title()} Não Informado').to_pandas()
+            # Categórica: filtros e groupbys passam a operar sobre códigos inteiros
+            df[col] = df[col].astype('category')
+
+    if 'ANO_REFER' in df.columns:
+        df['ANO_REFER'] = pd.to_numeric(df['ANO_REFER'], errors='coerce').dropna().astype(int)
+
+    # Número de funcionários como inteiro compacto (o downcast só ocorre se não houver perda).
+    # Valores em R$ e as médias de membros (fracionárias) seguem em float64: o float32
+    # alteraria totais e médias exibidos e exportados.
+    if 'TOTAL_FUNCIONARIOS' in df.columns:
+        df['TOTAL_FUNCIONARIOS'] = pd.to_numeric(df['TOTAL_FUNCIONARIOS'], downcast='integer')
+
+    # Consolida os blocos (um 2D por tipo): cada coluna numérica fica contígua no bloco float64 e as
+    # seleções de várias colunas nas páginas não precisam juntar dezenas de blocos de uma coluna
+    df = df.copy()
+
+    # Versão do conteúdo (sha256 do CSV): entra na chave dos caches de filtros e agregações das
+    # páginas. Fica em df.attrs, que o Parquet do snapshot também preserva.
+    df.attrs['versao'] = hashlib.sha256(raw).hexdigest()[:16]
+
+    return df
+
+# Em memória, o DataFrame vale pelo mesmo prazo do snapshot: processos longos também passam a ver
+# a base atualizada. O snapshot Parquet é a camada em disco que sobrevive aos reinícios.
+# cache_resource: as sessões compartilham o mesmo DataFrame (só lido pelas páginas), sem uma cópia
+# por sessão na memória do servidor.
+@st.cache_resource(ttl=MAX_IDADE_SNAPSHOT, max_entries=1, show_spinner=False)
+def load_data(url: str) -> pd.DataFrame:
+    """DataFrame tratado da base. Erros são propagados: o cache_resource não os guarda, e a próxima
+    execução tenta de novo em vez de servir um DataFrame vazio até o fim do prazo."""
+    snapshot = caminho_snapshot(url)
+    df = None
+    if snapshot.exists() and time.time() - snapshot.stat().st_mtime < MAX_IDADE_SNAPSHOT:
+        try:
+            # O Parquet preserva os tipos (inclusive as categóricas): nenhuma conversão é refeita
+            df = pd.read_parquet(snapshot)
+        except Exception:
+            pass  # Snapshot ilegível: refaz a partir da fonte (e o regrava)
+    if df is None:
+        # O CSV sai da cópia em disco de baixar_csv quando não mudou (requisição condicional, 304)
+        raw = baixar_csv(url)
+        df = ler_artefato(url, raw)
+        if df is None:
+            df = processar_csv(raw)
+        try:
+            gravar_parquet(df, snapshot)
+        except Exception:
+            pass  # Sem disco gravável o app segue funcionando, apenas sem o snapshot
+
+    # Versões antigas do pandas não gravam df.attrs no Parquet
+    if 'versao' not in df.attrs:
+        df.attrs['versao'] = int(pd.util.hash_pandas_object(df, index=False).sum())
+
+    return df
 
 # --- Página Inicial (Home) ---
 # --- Página Inicial (Home) ---
@@ -84,9 +207,13 @@ def main():
 
     # Carrega os dados e salva na sessão para as outras páginas usarem
     github_url = "https://raw.githubusercontent.com/tovarich86/pesq_rem_CVM/main/dados_cvm_mesclados.csv"
-    with st.spinner("Conectando ao repositório e carregando a base de dados da CVM..."):
-        df_original = load_data(github_url)
-        
+    try:
+        with st.spinner("Conectando ao repositório e carregando a base de dados da CVM..."):
+            df_original = load_data(github_url)
+    except Exception as e:
+        st.error(f"Erro crítico ao carregar ou processar os dados: {e}")
+        df_original = pd.DataFrame()
+
     if not df_original.empty:
         st.session_state['df_completo'] = df_original
         st.success("✅ Dados carregados com sucesso! Utilize o menu lateral esquerdo para começar sua análise.")
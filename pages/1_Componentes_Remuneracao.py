@@ -1,10 +1,11 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import plotly.express as px
 import plotly.graph_objects as go
 
 # Atualizamos o import para trazer o formata_abrev
-from utils import get_default_index, create_download_button, renderizar_sidebar_global, format_year, formata_brl_int, formata_abrev
+from utils import get_default_index, opcoes_unicas, create_download_button, renderizar_sidebar_global, indexar_por_empresa, recortar_empresa, evolucao_anual, ranking_empresas, figura_ranking, format_year, formata_brl_int, formata_abrev
 
 st.set_page_config(layout="wide", page_title="Componentes da Remuneração", page_icon="🧩")
 
@@ -14,6 +15,8 @@ if 'df_completo' not in st.session_state:
 
 df_original = st.session_state['df_completo']
 df = renderizar_sidebar_global(df_original)
+chave_filtros = st.session_state['chave_filtros']
+df_indexado = indexar_por_empresa(df, chave_filtros)
 
 if df.empty:
     st.warning("Nenhum dado encontrado para os filtros globais selecionados.")
@@ -29,30 +32,70 @@ analysis_type = st.selectbox("Escolha o tipo de análise:", tipos_analise, index
 st.session_state['comp_analysis_type'] = analysis_type
 
 component_cols = {'Salário': 'REM_FIXA_SALARIO', 'Benefícios': 'REM_FIXA_BENEFICIOS', 'Comitês': 'REM_FIXA_COMITES', 'Bônus': 'REM_VAR_BONUS', 'PLR': 'REM_VAR_PLR', 'Comissões': 'REM_VAR_COMISSOES', 'Pós-Emprego': 'REM_POS_EMPREGO', 'Cessação': 'REM_CESSACAO_CARGO', 'Ações': 'REM_ACOES_BLOCO3', 'Outros': 'REM_FIXA_OUTROS'}
+# Mapa inverso (coluna -> rótulo) e a ordem fixa dos componentes no empilhamento dos gráficos
+nome_componente = {v: k for k, v in component_cols.items()}
+tipo_componente = pd.CategoricalDtype(categories=list(component_cols), ordered=True)
+# O load_data garante todas as colunas numéricas (ausentes entram zeradas), então a lista é fixa
+colunas_componentes = list(component_cols.values())
+agregacao_anual = {**dict.fromkeys(colunas_componentes, 'sum'), 'NUM_MEMBROS_TOTAL': 'first'}
+
+@st.cache_data
+def agrupar_composicao(_df, chave_filtros, empresa, ano):
+    """Soma dos componentes por órgão para uma empresa e ano, em cache por seleção."""
+    df_filtered = _df[(_df['NOME_COMPANHIA'] == empresa) & (_df['ANO_REFER'] == ano)]
+
+    # Soma por órgão direto nos códigos da categórica: poucas linhas e poucos grupos,
+    # onde o custo do groupby genérico do pandas é todo de despacho
+    orgaos = df_filtered['ORGAO_ADMINISTRACAO']
+    codes = orgaos.cat.codes.to_numpy()
+    somas = np.zeros((len(orgaos.cat.categories), len(colunas_componentes)))
+    np.add.at(somas, codes, df_filtered[colunas_componentes].to_numpy(dtype=float))
+    presentes = np.unique(codes)
+    df_grouped = pd.DataFrame(somas[presentes], columns=colunas_componentes,
+                              index=pd.Index(orgaos.cat.categories[presentes], name='ORGAO_ADMINISTRACAO'))
+    df_grouped['Total'] = df_grouped.sum(axis=1)
+    return df_grouped[df_grouped['Total'] > 0]
+
+@st.cache_data
+def evolucao_componentes(_df_sel, chave, calc_type):
+    """Dados anuais (com Total, por membro se pedido) e o formato longo do gráfico, em cache por seleção."""
+    yearly_data = evolucao_anual(_df_sel, chave, agregacao_anual)
+    yearly_data['Total'] = yearly_data[colunas_componentes].sum(axis=1)
+
+    if calc_type == "Média por Membro":
+        yearly_data = yearly_data[yearly_data['NUM_MEMBROS_TOTAL'] > 0]
+        yearly_data[colunas_componentes] = yearly_data[colunas_componentes].div(yearly_data['NUM_MEMBROS_TOTAL'], axis=0)
+        yearly_data['Total'] = yearly_data['Total'] / yearly_data['NUM_MEMBROS_TOTAL']
+
+    # Formato longo (Ano, Componente, Valor) na mesma ordem do melt, com 'Componente' já categórica
+    n_anos = len(yearly_data)
+    df_plot = pd.DataFrame({
+        'ANO_REFER': np.tile(yearly_data['ANO_REFER'].to_numpy(), len(colunas_componentes)),
+        'Componente': pd.Categorical.from_codes(np.repeat(np.arange(len(colunas_componentes)), n_anos), dtype=tipo_componente),
+        'Valor': yearly_data[colunas_componentes].to_numpy().ravel(order='F'),
+    })
+    return yearly_data, df_plot[df_plot['Valor'] > 0]
 
 if analysis_type == "Composição por Empresa (Ano Único)":
     st.subheader("Composição da Remuneração por Órgão")
     col1, col2 = st.columns(2)
     with col1:
-        empresas = sorted(df['NOME_COMPANHIA'].unique())
+        empresas = opcoes_unicas(df, chave_filtros, 'NOME_COMPANHIA')
         if 'empresa_comp_1' not in st.session_state: st.session_state['empresa_comp_1'] = empresas[0]
         empresa = st.selectbox("1. Selecione a Empresa", empresas, index=get_default_index(empresas, st.session_state['empresa_comp_1']))
         st.session_state['empresa_comp_1'] = empresa
         
-    df_empresa = df[df['NOME_COMPANHIA'] == empresa]
+    df_empresa = recortar_empresa(df_indexado, empresa)
     with col2:
-        anos = sorted(df_empresa['ANO_REFER'].unique(), reverse=True)
+        anos = opcoes_unicas(df_empresa, (chave_filtros, empresa), 'ANO_REFER', reverse=True)
         ano = st.selectbox("2. Selecione o Ano", anos)
 
-    df_filtered = df_empresa[df_empresa['ANO_REFER'] == ano]
-    df_grouped = df_filtered.groupby('ORGAO_ADMINISTRACAO')[[col for col in component_cols.values() if col in df_filtered.columns]].sum()
-    df_grouped['Total'] = df_grouped.sum(axis=1)
-    df_grouped = df_grouped[df_grouped['Total'] > 0]
+    df_grouped = agrupar_composicao(df, chave_filtros, empresa, ano)
     
     if not df_grouped.empty:
         df_plot = df_grouped.drop(columns='Total').reset_index().melt(id_vars='ORGAO_ADMINISTRACAO', var_name='Componente', value_name='Valor')
         df_plot = df_plot[df_plot['Valor'] > 0]
-        df_plot['Componente'] = df_plot['Componente'].map({v: k for k, v in component_cols.items()})
+        df_plot['Componente'] = df_plot['Componente'].map(nome_componente).astype(tipo_componente)
         
         # --- NOVIDADE: Cálculo de Porcentagem e Rótulos ---
         totals_df = df_grouped[['Total']].reset_index()
@@ -80,34 +123,22 @@ elif analysis_type == "Evolução Anual Comparativa (por Empresa)":
     st.subheader("Evolução Anual dos Componentes")
     col1, col2, col3 = st.columns(3)
     with col1:
-        empresas = sorted(df['NOME_COMPANHIA'].unique())
+        empresas = opcoes_unicas(df, chave_filtros, 'NOME_COMPANHIA')
         if 'empresa_comp_2' not in st.session_state: st.session_state['empresa_comp_2'] = empresas[0]
         empresa = st.selectbox("1. Selecione a Empresa", empresas, index=get_default_index(empresas, st.session_state['empresa_comp_2']))
         st.session_state['empresa_comp_2'] = empresa
         
-    df_empresa = df[df['NOME_COMPANHIA'] == empresa]
+    df_empresa = recortar_empresa(df_indexado, empresa)
     with col2:
-        orgaos_disponiveis = sorted(df_empresa['ORGAO_ADMINISTRACAO'].unique())
+        orgaos_disponiveis = opcoes_unicas(df_empresa, (chave_filtros, empresa), 'ORGAO_ADMINISTRACAO')
         if 'orgao_comp_2' not in st.session_state: st.session_state['orgao_comp_2'] = 'DIRETORIA ESTATUTARIA'
         orgao = st.selectbox("2. Selecione o Órgão", orgaos_disponiveis, index=get_default_index(orgaos_disponiveis, st.session_state['orgao_comp_2']))
         st.session_state['orgao_comp_2'] = orgao
     with col3:
         calc_type = st.radio("Calcular por:", ["Total", "Média por Membro"], horizontal=True)
 
-    df_filtered = df_empresa[df_empresa['ORGAO_ADMINISTRACAO'] == orgao]
-    yearly_data = df_filtered.groupby('ANO_REFER').agg({**{col: 'sum' for col in component_cols.values() if col in df.columns}, 'NUM_MEMBROS_TOTAL': 'first'}).reset_index()
-    yearly_data['Total'] = yearly_data[[col for col in component_cols.values() if col in yearly_data.columns]].sum(axis=1)
-    
-    if calc_type == "Média por Membro":
-        yearly_data = yearly_data[yearly_data['NUM_MEMBROS_TOTAL'] > 0]
-        for col in component_cols.values():
-            if col in yearly_data.columns:
-                yearly_data[col] = yearly_data[col] / yearly_data['NUM_MEMBROS_TOTAL']
-        yearly_data['Total'] = yearly_data['Total'] / yearly_data['NUM_MEMBROS_TOTAL']
-        
-    df_plot = yearly_data.melt(id_vars=['ANO_REFER'], value_vars=[col for col in component_cols.values() if col in yearly_data.columns], var_name='Componente', value_name='Valor')
-    df_plot = df_plot[df_plot['Valor'] > 0]
-    df_plot['Componente'] = df_plot['Componente'].map({v: k for k, v in component_cols.items()})
+    df_filtered = recortar_empresa(df_indexado, empresa, orgao)
+    yearly_data, df_plot = evolucao_componentes(df_filtered, (chave_filtros, empresa, orgao), calc_type)
     
     if not df_plot.empty:
         yearly_data['ANO_REFER_FORMATTED'] = yearly_data['ANO_REFER'].apply(format_year)
@@ -143,9 +174,9 @@ elif analysis_type == "Ranking de Empresas (Top 15)":
     st.subheader("Ranking de Empresas por Componente de Remuneração")
     col1, col2, col3 = st.columns(3)
     with col1:
-        ano = st.selectbox("1. Selecione o Ano", sorted(df['ANO_REFER'].unique(), reverse=True))
+        ano = st.selectbox("1. Selecione o Ano", opcoes_unicas(df, chave_filtros, 'ANO_REFER', reverse=True))
     with col2:
-        orgaos_disponiveis = sorted(df['ORGAO_ADMINISTRACAO'].unique())
+        orgaos_disponiveis = opcoes_unicas(df, chave_filtros, 'ORGAO_ADMINISTRACAO')
         orgao = st.selectbox("2. Selecione o Órgão", orgaos_disponiveis, index=get_default_index(orgaos_disponiveis, 'DIRETORIA ESTATUTARIA'))
     rank_options = {'Remuneração Total': 'TOTAL_REMUNERACAO_ORGAO', **component_cols}
     with col3:
@@ -153,19 +184,12 @@ elif analysis_type == "Ranking de Empresas (Top 15)":
         
     col_rank = rank_options[rank_metric_name]
     calc_type = st.radio("Calcular por:", ["Total", "Média por Membro"], horizontal=True)
-    df_filtered = df[(df['ANO_REFER'] == ano) & (df['ORGAO_ADMINISTRACAO'] == orgao)]
-    
-    if calc_type == "Total":
-        df_rank = df_filtered.groupby('NOME_COMPANHIA')[col_rank].sum().nlargest(15).reset_index()
-    else: 
-        df_agg = df_filtered.groupby('NOME_COMPANHIA').agg(Valor=(col_rank, 'sum'), Membros=('NUM_MEMBROS_TOTAL', 'first')).reset_index()
-        df_agg = df_agg[df_agg['Membros'] > 0]
-        df_agg[col_rank] = df_agg['Valor'] / df_agg['Membros']
-        df_rank = df_agg.nlargest(15, col_rank)
+    df_rank = ranking_empresas(df, chave_filtros, ano, orgao, col_rank, 'NUM_MEMBROS_TOTAL', calc_type)
         
     if not df_rank.empty and df_rank[col_rank].sum() > 0:
-        fig = px.bar(df_rank.sort_values(by=col_rank), x=col_rank, y='NOME_COMPANHIA', orientation='h', text_auto='.2s', title=f"Top 15 Empresas por {rank_metric_name} ({calc_type}) em {format_year(ano)}")
-        fig.update_layout(yaxis={'categoryorder':'total ascending'}, xaxis_title=f"Valor {calc_type} (R$)", yaxis_title="Empresa", separators=",.")
+        fig = figura_ranking(df_rank, (chave_filtros, ano, orgao, col_rank, calc_type), col_rank,
+                             f"Top 15 Empresas por {rank_metric_name} ({calc_type}) em {format_year(ano)}",
+                             xaxis_title=f"Valor {calc_type} (R$)", yaxis_title="Empresa")
         st.plotly_chart(fig, use_container_width=True)
         create_download_button(df_rank, f"ranking_componentes_{ano}_{orgao}")
     else:
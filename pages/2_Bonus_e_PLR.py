@@ -1,9 +1,10 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import plotly.express as px
 
 # Adicionamos o formata_abrev aqui também
-from utils import get_default_index, create_download_button, renderizar_sidebar_global, format_year, formata_abrev
+from utils import get_default_index, opcoes_unicas, create_download_button, renderizar_sidebar_global, indexar_por_empresa, recortar_empresa, evolucao_anual, ranking_empresas, figura_ranking, format_year, formata_abrev
 
 st.set_page_config(layout="wide", page_title="Bônus e PLR", page_icon="🎯")
 
@@ -13,6 +14,8 @@ if 'df_completo' not in st.session_state:
 
 df_original = st.session_state['df_completo']
 df = renderizar_sidebar_global(df_original)
+chave_filtros = st.session_state['chave_filtros']
+df_indexado = indexar_por_empresa(df, chave_filtros)
 
 if df.empty:
     st.warning("Nenhum dado encontrado para os filtros globais selecionados.")
@@ -23,15 +26,15 @@ st.subheader("Evolução Comparativa de Bônus e PLR")
 
 col1, col2, col3 = st.columns(3)
 with col1:
-    empresas = sorted(df['NOME_COMPANHIA'].unique())
+    empresas = opcoes_unicas(df, chave_filtros, 'NOME_COMPANHIA')
     if 'empresa_bonus' not in st.session_state: st.session_state['empresa_bonus'] = empresas[0]
     empresa = st.selectbox("1. Selecione a Empresa", empresas, index=get_default_index(empresas, st.session_state['empresa_bonus']))
     st.session_state['empresa_bonus'] = empresa
     
-df_empresa = df[df['NOME_COMPANHIA'] == empresa]
+df_empresa = recortar_empresa(df_indexado, empresa)
 
 with col2:
-    orgaos_disponiveis = sorted(df_empresa['ORGAO_ADMINISTRACAO'].unique())
+    orgaos_disponiveis = opcoes_unicas(df_empresa, (chave_filtros, empresa), 'ORGAO_ADMINISTRACAO')
     if 'orgao_bonus' not in st.session_state: st.session_state['orgao_bonus'] = 'DIRETORIA ESTATUTARIA'
     orgao = st.selectbox("2. Selecione o Órgão", orgaos_disponiveis, index=get_default_index(orgaos_disponiveis, st.session_state['orgao_bonus']))
     st.session_state['orgao_bonus'] = orgao
@@ -39,17 +42,18 @@ with col2:
 with col3:
     calc_type = st.radio("Calcular por:", ["Total", "Média por Membro"], horizontal=True)
 
-df_filtered = df_empresa[df_empresa['ORGAO_ADMINISTRACAO'] == orgao]
+df_filtered = recortar_empresa(df_indexado, empresa, orgao)
 bonus_cols = {'Bônus Mínimo': 'BONUS_MIN', 'Bônus Alvo': 'BONUS_ALVO', 'Bônus Máximo': 'BONUS_MAX', 'Bônus Pago': 'BONUS_PAGO', 'PLR Mínimo': 'PLR_MIN', 'PLR Alvo': 'PLR_ALVO', 'PLR Máximo': 'PLR_MAX', 'PLR Pago': 'PLR_PAGO'}
-yearly_data = df_filtered.groupby('ANO_REFER').agg({**{col: 'sum' for col in bonus_cols.values() if col in df.columns}, 'NUM_MEMBROS_BONUS_PLR': 'first'}).reset_index()
+# O load_data garante todas as colunas numéricas (ausentes entram zeradas), então a lista é fixa
+colunas_bonus = list(bonus_cols.values())
+agregacao_anual = {**dict.fromkeys(colunas_bonus, 'sum'), 'NUM_MEMBROS_BONUS_PLR': 'first'}
+yearly_data = evolucao_anual(df_filtered, (chave_filtros, empresa, orgao), agregacao_anual)
 
 if calc_type == "Média por Membro":
     yearly_data = yearly_data[yearly_data['NUM_MEMBROS_BONUS_PLR'] > 0]
-    for col in bonus_cols.values():
-        if col in yearly_data.columns:
-            yearly_data[col] = yearly_data[col] / yearly_data['NUM_MEMBROS_BONUS_PLR']
+    yearly_data[colunas_bonus] = yearly_data[colunas_bonus].div(yearly_data['NUM_MEMBROS_BONUS_PLR'], axis=0)
 
-df_plot = yearly_data.melt(id_vars=['ANO_REFER'], value_vars=[col for col in bonus_cols.values() if col in yearly_data.columns], var_name='Métrica', value_name='Valor')
+df_plot = yearly_data.melt(id_vars=['ANO_REFER'], value_vars=colunas_bonus, var_name='Métrica', value_name='Valor')
 df_plot = df_plot[df_plot['Valor'] > 0]
 df_plot['Tipo'] = df_plot['Métrica'].apply(lambda x: 'Bônus' if 'BONUS' in x else 'PLR')
 df_plot['Métrica'] = df_plot['Métrica'].map({v: k for k, v in bonus_cols.items()})
@@ -74,29 +78,35 @@ if not df_plot.empty:
     st.plotly_chart(fig, use_container_width=True)
     create_download_button(df_plot, f"evolucao_bonus_plr_{empresa}_{orgao}")
 
+    # Percentuais de todos os anos calculados de uma vez (NaN onde não há alvo)
+    def perc_do_alvo(col_valor, col_alvo):
+        valor = yearly_data[col_valor].to_numpy(dtype=float)
+        alvo = yearly_data[col_alvo].to_numpy(dtype=float)
+        return np.divide(valor, alvo, out=np.full_like(alvo, np.nan), where=alvo > 0) * 100
+
+    anos_perf = yearly_data['ANO_REFER'].to_numpy()
+    perc_bonus, perc_plr = perc_do_alvo('BONUS_PAGO', 'BONUS_ALVO'), perc_do_alvo('PLR_PAGO', 'PLR_ALVO')
+    perc_bonus_max, perc_plr_max = perc_do_alvo('BONUS_MAX', 'BONUS_ALVO'), perc_do_alvo('PLR_MAX', 'PLR_ALVO')
+
     st.subheader("Performance: % do Alvo Efetivamente Pago")
     perf_cols = st.columns(len(yearly_data))
-    for i, row in yearly_data.iterrows():
+    for i, ano in enumerate(anos_perf):
         with perf_cols[i]:
-            st.write(f"**{format_year(row['ANO_REFER'])}**")
-            if row.get('BONUS_ALVO', 0) > 0:
-                perc_bonus = (row.get('BONUS_PAGO', 0) / row['BONUS_ALVO']) * 100
-                st.metric(label="Bônus", value=f"{perc_bonus:.1f}%")
-            if row.get('PLR_ALVO', 0) > 0:
-                perc_plr = (row.get('PLR_PAGO', 0) / row['PLR_ALVO']) * 100
-                st.metric(label="PLR", value=f"{perc_plr:.1f}%")
+            st.write(f"**{format_year(ano)}**")
+            if not np.isnan(perc_bonus[i]):
+                st.metric(label="Bônus", value=f"{perc_bonus[i]:.1f}%")
+            if not np.isnan(perc_plr[i]):
+                st.metric(label="PLR", value=f"{perc_plr[i]:.1f}%")
 
     st.subheader("Potencial Máximo: % do Alvo")
     perf_max_cols = st.columns(len(yearly_data))
-    for i, row in yearly_data.iterrows():
+    for i, ano in enumerate(anos_perf):
         with perf_max_cols[i]:
-            st.write(f"**{format_year(row['ANO_REFER'])}**")
-            if row.get('BONUS_ALVO', 0) > 0:
-                perc_bonus_max = (row.get('BONUS_MAX', 0) / row['BONUS_ALVO']) * 100
-                st.metric(label="Bônus (Máximo vs Alvo)", value=f"{perc_bonus_max:.1f}%")
-            if row.get('PLR_ALVO', 0) > 0:
-                perc_plr_max = (row.get('PLR_MAX', 0) / row['PLR_ALVO']) * 100
-                st.metric(label="PLR (Máximo vs Alvo)", value=f"{perc_plr_max:.1f}%")
+            st.write(f"**{format_year(ano)}**")
+            if not np.isnan(perc_bonus_max[i]):
+                st.metric(label="Bônus (Máximo vs Alvo)", value=f"{perc_bonus_max[i]:.1f}%")
+            if not np.isnan(perc_plr_max[i]):
+                st.metric(label="PLR (Máximo vs Alvo)", value=f"{perc_plr_max[i]:.1f}%")
 else:
     st.info("Não há dados de Bônus ou PLR para exibir para a seleção atual.")
 
@@ -104,27 +114,19 @@ st.markdown("---")
 st.subheader("Ranking de Empresas por Bônus/PLR")
 col_rank1, col_rank2, col_rank3 = st.columns(3)
 with col_rank1:
-    ano_rank = st.selectbox("1. Selecione o Ano", sorted(df['ANO_REFER'].unique(), reverse=True))
+    ano_rank = st.selectbox("1. Selecione o Ano", opcoes_unicas(df, chave_filtros, 'ANO_REFER', reverse=True))
 with col_rank2:
     rank_metric_name = st.selectbox("2. Rankear por:", list(bonus_cols.keys()))
 with col_rank3:
     calc_type_rank = st.radio("Calcular Ranking por:", ["Total", "Média por Membro"], horizontal=True)
 
 col_rank = bonus_cols[rank_metric_name]
-df_rank_filtered = df[df['ANO_REFER'] == ano_rank]
-
-if calc_type_rank == "Total":
-    df_rank = df_rank_filtered.groupby('NOME_COMPANHIA')[col_rank].sum().nlargest(15).reset_index()
-else:
-    df_agg = df_rank_filtered.groupby('NOME_COMPANHIA').agg(Valor=(col_rank, 'sum'), Membros=('NUM_MEMBROS_BONUS_PLR', 'first')).reset_index()
-    df_agg = df_agg[df_agg['Membros'] > 0]
-    df_agg[col_rank] = df_agg['Valor'] / df_agg['Membros']
-    df_rank = df_agg.nlargest(15, col_rank)
+df_rank = ranking_empresas(df, chave_filtros, ano_rank, None, col_rank, 'NUM_MEMBROS_BONUS_PLR', calc_type_rank)
     
 if not df_rank.empty and df_rank[col_rank].sum() > 0:
-    fig_rank = px.bar(df_rank.sort_values(by=col_rank), x=col_rank, y='NOME_COMPANHIA', orientation='h', text_auto='.2s', 
-                      title=f"Top 15 Empresas por {rank_metric_name} ({calc_type_rank}) em {format_year(ano_rank)}", template="streamlit") 
-    fig_rank.update_layout(yaxis={'categoryorder':'total ascending'}, xaxis_title=f"Valor {calc_type_rank} (R$)", yaxis_title="Empresa", separators=",.")
+    fig_rank = figura_ranking(df_rank, (chave_filtros, ano_rank, col_rank, calc_type_rank), col_rank,
+                              f"Top 15 Empresas por {rank_metric_name} ({calc_type_rank}) em {format_year(ano_rank)}", template="streamlit",
+                              xaxis_title=f"Valor {calc_type_rank} (R$)", yaxis_title="Empresa")
     st.plotly_chart(fig_rank, use_container_width=True)
     create_download_button(df_rank, f"ranking_bonus_plr_{ano_rank}")
 else:
@@ -1,8 +1,10 @@
 import streamlit as st
+import pandas as pd
+import numpy as np
 import plotly.express as px
 
 # Importa as nossas funções partilhadas do utils.py
-from utils import get_default_index, create_download_button, renderizar_sidebar_global, format_year
+from utils import get_default_index, opcoes_unicas, opcoes_do_recorte, create_download_button, renderizar_sidebar_global, indexar_por_empresa, recortar_empresa, indexar_por_ano, recortar_ano, maiores_valores, figura_ranking, format_year
 
 st.set_page_config(layout="wide", page_title="Remuneração Individual (Mín, Méd, Max)", page_icon="💰")
 
@@ -14,6 +16,8 @@ if 'df_completo' not in st.session_state:
 # Recupera os dados e desenha a barra lateral global
 df_original = st.session_state['df_completo']
 df = renderizar_sidebar_global(df_original)
+chave_filtros = st.session_state['chave_filtros']
+df_indexado = indexar_por_empresa(df, chave_filtros)
 
 if df.empty:
     st.warning("Nenhum dado encontrado para os filtros globais selecionados.")
@@ -25,7 +29,7 @@ st.subheader("Evolução Comparativa por Empresa (2022-2024)")
 col1, col2 = st.columns(2)
 
 with col1:
-    orgaos_disponiveis = sorted(df['ORGAO_ADMINISTRACAO'].unique())
+    orgaos_disponiveis = opcoes_unicas(df, chave_filtros, 'ORGAO_ADMINISTRACAO')
     # Guarda o órgão no estado da sessão para não perder a seleção ao mudar de página
     if 'orgao_ind_selecionado' not in st.session_state: st.session_state['orgao_ind_selecionado'] = 'DIRETORIA ESTATUTARIA'
     idx_orgao = get_default_index(orgaos_disponiveis, st.session_state['orgao_ind_selecionado'])
@@ -33,10 +37,8 @@ with col1:
     orgao = st.selectbox("1. Selecione o Órgão", orgaos_disponiveis, index=idx_orgao, key='orgao_ind')
     st.session_state['orgao_ind_selecionado'] = orgao
 
-df_orgao = df[df['ORGAO_ADMINISTRACAO'] == orgao]
-
 with col2:
-    empresas_disponiveis = sorted(df_orgao['NOME_COMPANHIA'].unique())
+    empresas_disponiveis = opcoes_do_recorte(df, chave_filtros, 'ORGAO_ADMINISTRACAO', orgao, 'NOME_COMPANHIA')
     if not empresas_disponiveis:
         st.warning("Nenhuma empresa encontrada para o órgão selecionado.")
         st.stop()
@@ -48,14 +50,18 @@ with col2:
     st.session_state['empresa_ind_selecionada'] = empresa
 
 # --- Gráfico de Evolução ---
-df_filtered = df_orgao[(df_orgao['NOME_COMPANHIA'] == empresa) & (df_orgao['ANO_REFER'].isin([2022, 2023, 2024]))]
+df_filtered = recortar_empresa(df_indexado, empresa, orgao)
+df_filtered = df_filtered[df_filtered['ANO_REFER'].isin([2022, 2023, 2024])]
 
 if not df_filtered.empty:
-    df_analysis = df_filtered[['ANO_REFER', 'REM_MAXIMA_INDIVIDUAL', 'REM_MEDIA_INDIVIDUAL', 'REM_MINIMA_INDIVIDUAL']]
-    df_plot = df_analysis.melt(id_vars=['ANO_REFER'], value_vars=['REM_MAXIMA_INDIVIDUAL', 'REM_MEDIA_INDIVIDUAL', 'REM_MINIMA_INDIVIDUAL'], var_name='Métrica', value_name='Valor')
-    
+    # Formato longo (Ano, Métrica, Valor) montado direto dos arrays: são no máximo 3 anos x 3 métricas
     metric_names = {'REM_MAXIMA_INDIVIDUAL': 'Máxima', 'REM_MEDIA_INDIVIDUAL': 'Média', 'REM_MINIMA_INDIVIDUAL': 'Mínima'}
-    df_plot['Métrica'] = df_plot['Métrica'].map(metric_names)
+    anos = df_filtered['ANO_REFER'].to_numpy()
+    df_plot = pd.DataFrame({
+        'ANO_REFER': np.tile(anos, len(metric_names)),
+        'Métrica': np.repeat(list(metric_names.values()), len(anos)),
+        'Valor': np.concatenate([df_filtered[col].to_numpy() for col in metric_names]),
+    })
     df_plot = df_plot[df_plot['Valor'] > 0]
     
     if not df_plot.empty:
@@ -75,22 +81,20 @@ st.subheader("Ranking de Empresas por Remuneração Individual")
 
 col_bar1, col_bar2 = st.columns(2)
 with col_bar1:
-    ano_bar = st.selectbox("Selecione o Ano para o Ranking", sorted(df['ANO_REFER'].unique(), reverse=True), key='ano_bar')
+    ano_bar = st.selectbox("Selecione o Ano para o Ranking", opcoes_unicas(df, chave_filtros, 'ANO_REFER', reverse=True), key='ano_bar')
 with col_bar2:
     metric_options = {'Máxima': 'REM_MAXIMA_INDIVIDUAL', 'Média': 'REM_MEDIA_INDIVIDUAL', 'Mínima': 'REM_MINIMA_INDIVIDUAL'}
     metrica_selecionada = st.selectbox("Selecione a Métrica", list(metric_options.keys()), key='metrica_bar')
 
-df_bar = df[(df['ANO_REFER'] == ano_bar) & (df['ORGAO_ADMINISTRACAO'] == orgao)]
+df_bar = recortar_ano(indexar_por_ano(df, chave_filtros), ano_bar, orgao)
 coluna_metrica = metric_options[metrica_selecionada]
-df_bar = df_bar[df_bar[coluna_metrica] > 0]
-df_top_companies = df_bar.nlargest(15, coluna_metrica)
+df_bar = df_bar.loc[df_bar[coluna_metrica].to_numpy() > 0]
+df_top_companies = maiores_valores(df_bar, coluna_metrica, 15)
 
 if not df_top_companies.empty:
-    fig_bar = px.bar(df_top_companies.sort_values(by=coluna_metrica), x=coluna_metrica, y='NOME_COMPANHIA', 
-                     orientation='h', text_auto='.2s', 
-                     title=f"Top 15 Empresas por Remuneração {metrica_selecionada} ({orgao}, {format_year(ano_bar)})", 
-                     labels={coluna_metrica: f"Remuneração {metrica_selecionada} (R$)", 'NOME_COMPANHIA': 'Empresa'})
-    fig_bar.update_layout(yaxis={'categoryorder':'total ascending'}, separators=",.")
+    fig_bar = figura_ranking(df_top_companies, (chave_filtros, ano_bar, orgao, coluna_metrica), coluna_metrica,
+                             f"Top 15 Empresas por Remuneração {metrica_selecionada} ({orgao}, {format_year(ano_bar)})",
+                             labels={coluna_metrica: f"Remuneração {metrica_selecionada} (R$)", 'NOME_COMPANHIA': 'Empresa'})
     st.plotly_chart(fig_bar, use_container_width=True)
     create_download_button(df_top_companies[['NOME_COMPANHIA', coluna_metrica]], f"ranking_rem_individual_{ano_bar}")
 else:
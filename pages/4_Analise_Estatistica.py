@@ -1,7 +1,7 @@
 import streamlit as st
 import pandas as pd
 
-from utils import get_default_index, create_download_button, renderizar_sidebar_global, format_year, formata_brl
+from utils import get_default_index, opcoes_unicas, create_download_button, renderizar_sidebar_global, format_year, formata_brl
 
 st.set_page_config(layout="wide", page_title="Análise Estatística", page_icon="📈")
 
@@ -11,6 +11,7 @@ if 'df_completo' not in st.session_state:
 
 df_original = st.session_state['df_completo']
 df = renderizar_sidebar_global(df_original)
+chave_filtros = st.session_state['chave_filtros']
 
 if df.empty:
     st.warning("Nenhum dado encontrado para os filtros globais selecionados.")
@@ -24,9 +25,9 @@ metric_options = {
 
 col1, col2, col3 = st.columns(3)
 with col1:
-    ano = st.selectbox("1. Selecione o Ano", sorted(df['ANO_REFER'].unique(), reverse=True))
+    ano = st.selectbox("1. Selecione o Ano", opcoes_unicas(df, chave_filtros, 'ANO_REFER', reverse=True))
 with col2:
-    orgaos_disponiveis = sorted(df['ORGAO_ADMINISTRACAO'].unique())
+    orgaos_disponiveis = opcoes_unicas(df, chave_filtros, 'ORGAO_ADMINISTRACAO')
     orgao = st.selectbox("2. Selecione o Órgão", orgaos_disponiveis, index=get_default_index(orgaos_disponiveis, 'DIRETORIA ESTATUTARIA'))
 with col3:
     metrica = st.selectbox("3. Selecione a Métrica", list(metric_options.keys()))
@@ -34,7 +35,6 @@ with col3:
 calc_type = st.radio("Calcular por:", ["Total", "Média por Membro"], horizontal=True)
 
 col_metrica = metric_options[metrica]
-df_filtered = df[(df['ANO_REFER'] == ano) & (df['ORGAO_ADMINISTRACAO'] == orgao)]
 
 if metrica in ['Bônus Pago']:
     membros_col = 'NUM_MEMBROS_BONUS_PLR'
@@ -42,14 +42,29 @@ elif metrica in ['Remuneração Máxima', 'Remuneração Média', 'Remuneração
     membros_col = 'NUM_MEMBROS_INDIVIDUAL'
 else:
     membros_col = 'NUM_MEMBROS_TOTAL'
-    
-if calc_type == "Média por Membro":
-    df_filtered = df_filtered[df_filtered[membros_col] > 0].copy()
-    df_filtered.loc[:, col_metrica] = df_filtered[col_metrica] / df_filtered[membros_col]
 
-df_filtered = df_filtered[df_filtered[col_metrica] > 0]
+nomes_estatisticas = {'count': 'Nº de Companhias', 'mean': 'Média', 'std': 'Desvio Padrão', 'min': 'Mínimo', '25%': '1º Quartil', '50%': 'Mediana (2º Q)', '75%': '3º Quartil', 'max': 'Máximo'}
 
-if not df_filtered.empty:
+@st.cache_data
+def estatisticas_quartis(_df, chave_filtros, ano, orgao, col_metrica, membros_col, calc_type):
+    """Estatísticas por setor e da amostra total para a seleção, em cache: ao voltar a uma combinação
+    já vista, o recorte e os describe() não são refeitos. Devolve (None, None) se não houver dados."""
+    df_filtered = _df[(_df['ANO_REFER'] == ano) & (_df['ORGAO_ADMINISTRACAO'] == orgao)]
+    if calc_type == "Média por Membro":
+        # assign troca só a coluna da métrica num novo DataFrame, sem copiar o recorte inteiro
+        df_filtered = df_filtered[df_filtered[membros_col] > 0]
+        df_filtered = df_filtered.assign(**{col_metrica: df_filtered[col_metrica] / df_filtered[membros_col]})
+    df_filtered = df_filtered[df_filtered[col_metrica] > 0]
+    if df_filtered.empty:
+        return None, None
+
+    df_stats_sector = df_filtered.groupby('SETOR_ATIVIDADE', observed=True)[col_metrica].describe().reset_index()
+    df_stats_total = df_filtered[col_metrica].describe().to_frame().T
+    return df_stats_sector.rename(columns=nomes_estatisticas), df_stats_total.rename(columns=nomes_estatisticas)
+
+df_stats_sector, df_stats_total = estatisticas_quartis(df, chave_filtros, ano, orgao, col_metrica, membros_col, calc_type)
+
+if df_stats_sector is not None:
     format_dict = {
         'Nº de Companhias': lambda x: f"{x:_.0f}".replace('_', '.'),
         'Média': formata_brl,
@@ -62,14 +77,10 @@ if not df_filtered.empty:
     }
 
     st.subheader(f"Estatísticas por Setor de Atividade ({format_year(ano)})")
-    df_stats_sector = df_filtered.groupby('SETOR_ATIVIDADE')[col_metrica].describe().reset_index()
-    df_stats_sector = df_stats_sector.rename(columns={'count': 'Nº de Companhias', 'mean': 'Média', 'std': 'Desvio Padrão', 'min': 'Mínimo', '25%': '1º Quartil', '50%': 'Mediana (2º Q)', '75%': '3º Quartil', 'max': 'Máximo'})
     st.dataframe(df_stats_sector.style.format(format_dict))
     create_download_button(df_stats_sector, f"estatisticas_setor_{ano}_{orgao}")
 
     st.subheader(f"Estatísticas para a Amostra Total Filtrada ({format_year(ano)})")
-    df_stats_total = df_filtered[col_metrica].describe().to_frame().T
-    df_stats_total = df_stats_total.rename(columns={'count': 'Nº de Companhias', 'mean': 'Média', 'std': 'Desvio Padrão', 'min': 'Mínimo', '25%': '1º Quartil', '50%': 'Mediana (2º Q)', '75%': '3º Quartil', 'max': 'Máximo'})
     st.dataframe(df_stats_total.style.format(format_dict))
     create_download_button(df_stats_total, f"estatisticas_total_{ano}_{orgao}")
 else:
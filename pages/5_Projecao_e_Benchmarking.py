@@ -1,9 +1,10 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import plotly.express as px
 
 # Importações dos utilitários
-from utils import get_default_index, renderizar_sidebar_global, formata_abrev, create_download_button
+from utils import get_default_index, opcoes_unicas, renderizar_sidebar_global, indexar_por_empresa, recortar_empresa, formata_abrev, create_download_button
 
 st.set_page_config(layout="wide", page_title="Projeção e Benchmarking", page_icon="🚀")
 
@@ -13,6 +14,9 @@ if 'df_completo' not in st.session_state:
 
 df_original = st.session_state['df_completo']
 df = renderizar_sidebar_global(df_original)
+chave_filtros = st.session_state['chave_filtros']
+# Índice (empresa, órgão) em cache: a base e cada par saem por busca binária, sem varrer o DataFrame
+df_indexado = indexar_por_empresa(df, chave_filtros)
 
 if df.empty:
     st.warning("Nenhum dado encontrado para os filtros globais selecionados.")
@@ -40,8 +44,8 @@ st.markdown("---")
 st.subheader("1. Configuração do Cenário")
 
 col1, col2, col3 = st.columns(3)
-empresas_disponiveis = sorted(df['NOME_COMPANHIA'].unique())
-orgaos_disponiveis = sorted(df['ORGAO_ADMINISTRACAO'].unique())
+empresas_disponiveis = opcoes_unicas(df, chave_filtros, 'NOME_COMPANHIA')
+orgaos_disponiveis = opcoes_unicas(df, chave_filtros, 'ORGAO_ADMINISTRACAO')
 
 with col1:
     if 'empresa_proj' not in st.session_state: st.session_state['empresa_proj'] = empresas_disponiveis[0]
@@ -63,17 +67,15 @@ st.subheader("2. Edição de Dados da Empresa Base")
 st.info("💡 Clique nas células das colunas **2025** e **2026** para alterar os valores.")
 
 # --- PREPARAÇÃO DOS DADOS DA EMPRESA BASE ---
-df_base = df[(df['NOME_COMPANHIA'] == empresa_base) & (df['ORGAO_ADMINISTRACAO'] == orgao)]
+df_base = recortar_empresa(df_indexado, empresa_base, orgao)
 anos_historicos = [2022, 2023, 2024, 2025]
-dados_editor = {ano: {comp: 0.0 for comp in component_cols.keys()} for ano in anos_historicos}
 
-for ano in anos_historicos:
-    df_ano = df_base[df_base['ANO_REFER'] == ano]
-    if not df_ano.empty:
-        for comp_nome, col_db in component_cols.items():
-            dados_editor[ano][comp_nome] = float(df_ano[col_db].sum())
+def somas_por_ano(df_sel):
+    """Tabela Componente x Ano com a soma de cada componente, num único groupby (anos ausentes = 0)."""
+    somas = df_sel.groupby('ANO_REFER', sort=False)[list(component_cols.values())].sum().reindex(anos_historicos, fill_value=0.0)
+    return pd.DataFrame(somas.to_numpy(dtype=float).T, index=list(component_cols), columns=anos_historicos)
 
-df_editor_pd = pd.DataFrame(dados_editor)
+df_editor_pd = somas_por_ano(df_base)
 df_editor_pd[2026] = df_editor_pd[2025] # Sugere 2026 = 2025
 
 config_colunas = {
@@ -108,18 +110,16 @@ df_base_plot = df_base_plot.melt(id_vars='Componente', var_name='Ano', value_nam
 nome_tipo_base = f'{empresa_base} (Sua Projeção)'
 df_base_plot['Tipo'] = nome_tipo_base
 
-dados_pares_plot = []
 if pares:
-    df_pares = df[(df['NOME_COMPANHIA'].isin(pares)) & (df['ORGAO_ADMINISTRACAO'] == orgao)]
-    for par in pares:
-        df_par = df_pares[df_pares['NOME_COMPANHIA'] == par]
-        for ano in anos_historicos:
-            df_ano = df_par[df_par['ANO_REFER'] == ano]
-            for comp_nome, col_db in component_cols.items():
-                valor = float(df_ano[col_db].sum()) if not df_ano.empty else 0.0
-                dados_pares_plot.append({'Componente': comp_nome, 'Ano': ano, 'Valor': valor, 'Tipo': par})
-    
-    df_pares_plot_df = pd.DataFrame(dados_pares_plot)
+    # Formato longo montado direto dos arrays de cada par: por par, os anos em sequência e, em cada ano,
+    # os componentes na ordem de component_cols (a matriz Componente x Ano transposta e achatada)
+    n_anos, n_comp = len(anos_historicos), len(component_cols)
+    df_pares_plot_df = pd.DataFrame({
+        'Componente': np.tile(list(component_cols), n_anos * len(pares)),
+        'Ano': np.tile(np.repeat(anos_historicos, n_comp), len(pares)),
+        'Valor': np.concatenate([somas_por_ano(recortar_empresa(df_indexado, par, orgao)).to_numpy().T.ravel() for par in pares]),
+        'Tipo': np.repeat(pares, n_anos * n_comp),
+    })
     
     df_2025_pares = df_pares_plot_df[df_pares_plot_df['Ano'] == 2025].copy()
     df_2026_pares = df_2025_pares.copy()
@@ -143,7 +143,7 @@ if df_final_plot.empty:
     st.info("Não há dados para exibir no intervalo de anos selecionado.")
 else:
     # Cálculo de Porcentagem para não poluir barras muito pequenas com texto
-    totais_ano_tipo = df_final_plot.groupby(['Ano', 'Tipo'])['Valor'].transform('sum')
+    totais_ano_tipo = df_final_plot.groupby(['Ano', 'Tipo'], sort=False)['Valor'].transform('sum')
     df_final_plot['Perc'] = (df_final_plot['Valor'] / totais_ano_tipo) * 100
     df_final_plot['Texto'] = df_final_plot.apply(lambda row: formata_abrev(row['Valor']) if row['Perc'] >= 5 else "", axis=1)
     
@@ -1,10 +1,11 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import plotly.express as px
 import plotly.graph_objects as go
 
 # Importações dos utilitários
-from utils import get_default_index, renderizar_sidebar_global, formata_brl_int, formata_abrev, create_download_button
+from utils import get_default_index, opcoes_unicas, renderizar_sidebar_global, posicoes_por_ano, fatos_empresas, recortar_fatos, formata_brl_int, formata_abrev, create_download_button
 
 st.set_page_config(layout="wide", page_title="Governança e Risco", page_icon="⚖️")
 
@@ -14,6 +15,7 @@ if 'df_completo' not in st.session_state:
 
 df_original = st.session_state['df_completo']
 df = renderizar_sidebar_global(df_original)
+chave_filtros = st.session_state['chave_filtros']
 
 if df.empty:
     st.warning("Nenhum dado encontrado para os filtros globais selecionados.")
@@ -25,7 +27,7 @@ Este painel aplica métricas avançadas de Governança Corporativa para identifi
 """)
 
 # --- Filtro Global da Página ---
-anos_disponiveis = sorted(df['ANO_REFER'].unique(), reverse=True)
+anos_disponiveis = opcoes_unicas(df, chave_filtros, 'ANO_REFER', reverse=True)
 ano_selecionado = st.selectbox("Selecione o Ano de Referência para a Análise de Risco:", anos_disponiveis)
 
 st.markdown("---")
@@ -38,17 +40,19 @@ st.markdown("""
 O **Múltiplo de Dispersão** divide a Maior Remuneração pela Média da Diretoria. Valores muito altos indicam uma concentração excessiva de orçamento no CEO (Key Person Risk) e uma estrutura menos colaborativa.
 """)
 
-# Busca flexível: pega qualquer coisa que tenha "DIRETORIA", ignorando maiúsculas/minúsculas e acentos
-df_diretoria = df[(df['ANO_REFER'] == ano_selecionado) & (df['ORGAO_ADMINISTRACAO'].str.contains('DIRETORIA', case=False, na=False))].copy()
-
-# Cálculo do CEO Pay Slice
-df_diretoria['CEO_Pay_Slice'] = 0.0
+# Ano sem linhas (ou NaN, que o groupby descarta) dá um recorte vazio, tratado pelas mensagens abaixo
+df_ano = df.iloc[posicoes_por_ano(df, chave_filtros).get(ano_selecionado, np.empty(0, dtype=np.intp))]
 
-if 'REM_MEDIA_INDIVIDUAL' in df_diretoria.columns and 'REM_MAXIMA_INDIVIDUAL' in df_diretoria.columns:
-    mascara_validos = (df_diretoria['REM_MEDIA_INDIVIDUAL'] > 0) & (df_diretoria['REM_MAXIMA_INDIVIDUAL'] > 0)
-    df_diretoria.loc[mascara_validos, 'CEO_Pay_Slice'] = df_diretoria.loc[mascara_validos, 'REM_MAXIMA_INDIVIDUAL'] / df_diretoria.loc[mascara_validos, 'REM_MEDIA_INDIVIDUAL']
+# Busca flexível: pega qualquer coisa que tenha "DIRETORIA", ignorando maiúsculas/minúsculas e acentos
+df_diretoria = df_ano[df_ano['ORGAO_ADMINISTRACAO'].str.contains('DIRETORIA', case=False, na=False)]
 
-df_cps = df_diretoria[df_diretoria['CEO_Pay_Slice'] > 0].sort_values(by='CEO_Pay_Slice', ascending=False)
+# Cálculo do CEO Pay Slice: só as linhas válidas recebem a nova coluna, sem copiar o recorte da diretoria
+# (as colunas de remuneração sempre existem: o carregamento cria as ausentes com 0)
+maxima = df_diretoria['REM_MAXIMA_INDIVIDUAL'].to_numpy()
+media = df_diretoria['REM_MEDIA_INDIVIDUAL'].to_numpy()
+mascara_validos = (media > 0) & (maxima > 0)
+df_cps = df_diretoria[mascara_validos].assign(CEO_Pay_Slice=maxima[mascara_validos] / media[mascara_validos])
+df_cps = df_cps.sort_values(by='CEO_Pay_Slice', ascending=False)
 
 if df_cps.empty:
     st.info(f"📊 As empresas da amostra ainda não reportaram dados válidos de Remuneração Máxima e Média para o ano de **{ano_selecionado}**. Tente selecionar um ano anterior.")
@@ -72,9 +76,12 @@ else:
 
     with col2_cps:
         st.info("**Estatísticas do Mercado (Filtro Atual)**")
-        media_mercado = df_cps['CEO_Pay_Slice'].mean()
-        mediana_mercado = df_cps['CEO_Pay_Slice'].median()
-        maximo_mercado = df_cps['CEO_Pay_Slice'].max()
+        # df_cps já está em ordem decrescente: máximo e mediana saem por posição, sem novas varreduras
+        valores_cps = df_cps['CEO_Pay_Slice'].to_numpy()
+        n_cps = len(valores_cps)
+        media_mercado = valores_cps.mean()
+        mediana_mercado = (valores_cps[(n_cps - 1) // 2] + valores_cps[n_cps // 2]) / 2
+        maximo_mercado = valores_cps[0]
         
         st.metric("Média de Dispersão", f"{media_mercado:.1f}x" if pd.notna(media_mercado) else "N/A")
         st.metric("Mediana de Dispersão", f"{mediana_mercado:.1f}x" if pd.notna(mediana_mercado) else "N/A")
@@ -92,8 +99,6 @@ st.markdown("""
 Analisa se o Conselho de Administração é bem remunerado o suficiente para fiscalizar uma diretoria milionária. Gráfico exibe a Remuneração Total de cada órgão.
 """)
 
-df_ano = df[df['ANO_REFER'] == ano_selecionado].copy()
-
 # Criar uma coluna padronizada para o Pivot (imune a acentos do CSV)
 def padronizar_orgao(nome):
     nome_upper = str(nome).upper()
@@ -101,15 +106,19 @@ def padronizar_orgao(nome):
     if 'CONSELHO' in nome_upper: return 'CONSELHO'
     return 'OUTROS'
 
-df_ano['Orgao_Padrao'] = df_ano['ORGAO_ADMINISTRACAO'].apply(padronizar_orgao)
+# Totais por (órgão, empresa) no ano, recortados da tabela de fatos em cache; o órgão padrão é
+# resolvido sobre as poucas categorias do órgão, não linha a linha
+df_gov = recortar_fatos(fatos_empresas(df, chave_filtros), (ano_selecionado,))[['TOTAL_REMUNERACAO_ORGAO']].reset_index()
+df_gov['Orgao_Padrao'] = df_gov['ORGAO_ADMINISTRACAO'].map(padronizar_orgao)
 
 # Agregar total por empresa e por órgão padrão
-df_gov = df_ano[df_ano['Orgao_Padrao'].isin(['DIRETORIA', 'CONSELHO'])]
+df_gov = df_gov[df_gov['Orgao_Padrao'].isin(['DIRETORIA', 'CONSELHO'])]
 df_gov_pivot = df_gov.pivot_table(
     index='NOME_COMPANHIA', 
     columns='Orgao_Padrao', 
     values='TOTAL_REMUNERACAO_ORGAO', 
-    aggfunc='sum'
+    aggfunc='sum',
+    observed=True
 ).fillna(0).reset_index()
 
 # Filtra empresas que têm as duas informações
@@ -156,11 +165,11 @@ st.markdown("""
 Identifica empresas onde os pagamentos por rescisão (Cessação de Cargo e Pós-Emprego) representam uma parcela alarmante da remuneração total do órgão, um indicativo de alto risco moral para os investidores.
 """)
 
-df_ano['Rescisao_Total'] = df_ano['REM_CESSACAO_CARGO'].fillna(0) + df_ano['REM_POS_EMPREGO'].fillna(0)
-df_ano['Perc_Rescisao'] = 0.0
-
-mascara_rescisao = df_ano['TOTAL_REMUNERACAO_ORGAO'] > 0
-df_ano.loc[mascara_rescisao, 'Perc_Rescisao'] = (df_ano.loc[mascara_rescisao, 'Rescisao_Total'] / df_ano.loc[mascara_rescisao, 'TOTAL_REMUNERACAO_ORGAO']) * 100
+# As colunas derivadas entram via assign, num novo DataFrame: df_ano (recorte do filtro) segue só de leitura
+rescisao_total = df_ano['REM_CESSACAO_CARGO'].fillna(0) + df_ano['REM_POS_EMPREGO'].fillna(0)
+total_orgao = df_ano['TOTAL_REMUNERACAO_ORGAO'].to_numpy()
+perc_rescisao = np.divide(rescisao_total.to_numpy(), total_orgao, out=np.zeros(len(df_ano)), where=total_orgao > 0) * 100
+df_ano = df_ano.assign(Rescisao_Total=rescisao_total, Perc_Rescisao=perc_rescisao)
 
 # Filtra apenas empresas com algum valor de rescisão relevante (ex: > 1%)
 df_resc = df_ano[df_ano['Perc_Rescisao'] > 1.0].sort_values(by='Perc_Rescisao', ascending=False)
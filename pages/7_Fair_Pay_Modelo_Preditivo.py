@@ -11,7 +11,7 @@ from sklearn.pipeline import Pipeline
 from sklearn.impute import SimpleImputer
 from sklearn.model_selection import cross_val_score
 
-from utils import renderizar_sidebar_global, formata_brl_int, formata_abrev, create_download_button
+from utils import opcoes_unicas, renderizar_sidebar_global, posicoes_por_ano, formata_brl_int, formata_abrev, create_download_button
 
 st.set_page_config(layout="wide", page_title="Modelo Preditivo (Fair Pay)", page_icon="🤖")
 
@@ -21,6 +21,7 @@ if 'df_completo' not in st.session_state:
 
 df_original = st.session_state['df_completo']
 df = renderizar_sidebar_global(df_original)
+chave_filtros = st.session_state['chave_filtros']
 
 if df.empty:
     st.warning("Nenhum dado encontrado para os filtros selecionados.")
@@ -47,11 +48,10 @@ st.markdown("---")
 col_filtros1, col_filtros2 = st.columns(2)
 with col_filtros1:
     # FILTRO: Apenas anos com dados reais (2024 para trás)
-    anos_reais = [ano for ano in df['ANO_REFER'].unique() if ano <= 2024]
-    if not anos_reais:
+    anos_disponiveis = [ano for ano in opcoes_unicas(df, chave_filtros, 'ANO_REFER', reverse=True) if ano <= 2024]
+    if not anos_disponiveis:
         st.error("Não há dados de anos anteriores a 2025 para treinar o modelo de forma segura.")
         st.stop()
-    anos_disponiveis = sorted(anos_reais, reverse=True)
     ano_selecionado = st.selectbox("Selecione o Ano Base (Histórico Auditado):", anos_disponiveis)
 
 with col_filtros2:
@@ -67,8 +67,9 @@ dict_alvos = {
 }
 coluna_alvo = dict_alvos[alvo_selecionado]
 
-df_modelo = df[(df['ANO_REFER'] == ano_selecionado) & 
-               (df['ORGAO_ADMINISTRACAO'].str.contains('DIRETORIA', case=False, na=False))].copy()
+# Ano sem linhas (ou NaN, que o groupby descarta) dá um recorte vazio, tratado pelas mensagens abaixo
+df_ano = df.iloc[posicoes_por_ano(df, chave_filtros).get(ano_selecionado, np.empty(0, dtype=np.intp))]
+df_modelo = df_ano[df_ano['ORGAO_ADMINISTRACAO'].str.contains('DIRETORIA', case=False, na=False)].copy()
 
 df_modelo = df_modelo.dropna(subset=[coluna_alvo, 'SETOR_ATIVIDADE'])
 df_modelo = df_modelo[df_modelo[coluna_alvo] > 0]
@@ -117,35 +118,45 @@ features = features_categoricas + features_numericas
 X = df_modelo[features]
 y = np.log1p(df_modelo[coluna_alvo])
 
-numeric_transformer = Pipeline(steps=[
-    ('imputer', SimpleImputer(strategy='median')),
-    ('scaler', StandardScaler())
-])
+# cache_resource: o modelo treinado é compartilhado sem cópia (só é usado para predict). A amostra
+# é identificada por (filtros, ano, alvo); ao voltar a uma seleção, nem a validação cruzada nem o
+# treino são refeitos (o random_state fixo dá o mesmo modelo)
+@st.cache_resource(max_entries=16, show_spinner=False)
+def treinar_modelo(_X, _y, chave, usar_categoricas, cv_folds, min_leaf, max_depth):
+    """Treina o pipeline (pré-processamento + Random Forest) e devolve (modelo, R² médio da validação cruzada ou None)."""
+    numeric_transformer = Pipeline(steps=[
+        ('imputer', SimpleImputer(strategy='median')),
+        ('scaler', StandardScaler())
+    ])
 
-transformers_list = [('num', numeric_transformer, features_numericas)]
+    transformers_list = [('num', numeric_transformer, features_numericas)]
 
-if usar_categoricas:
-    categorical_transformer = Pipeline(steps=[
-        ('imputer', SimpleImputer(strategy='most_frequent')),
-        ('onehot', OneHotEncoder(handle_unknown='ignore'))
-    ])
-    transformers_list.append(('cat', categorical_transformer, features_categoricas))
+    if usar_categoricas:
+        categorical_transformer = Pipeline(steps=[
+            ('imputer', SimpleImputer(strategy='most_frequent')),
+            ('onehot', OneHotEncoder(handle_unknown='ignore'))
+        ])
+        transformers_list.append(('cat', categorical_transformer, features_categoricas))
 
-preprocessor = ColumnTransformer(transformers=transformers_list)
+    preprocessor = ColumnTransformer(transformers=transformers_list)
 
-modelo = Pipeline(steps=[
-    ('preprocessor', preprocessor), 
-    ('regressor', RandomForestRegressor(n_estimators=150, random_state=42, max_depth=max_depth, min_samples_leaf=min_leaf, bootstrap=True))
-])
+    modelo = Pipeline(steps=[
+        ('preprocessor', preprocessor), 
+        ('regressor', RandomForestRegressor(n_estimators=150, random_state=42, max_depth=max_depth, min_samples_leaf=min_leaf, bootstrap=True))
+    ])
 
-with st.spinner(f"Treinando IA e calculando Variância (R²)..."):
     if cv_folds >= 2:
-        cv_scores = cross_val_score(modelo, X, y, cv=cv_folds, scoring='r2')
+        cv_scores = cross_val_score(modelo, _X, _y, cv=cv_folds, scoring='r2')
         confianca = cv_scores.mean()
     else:
         confianca = None
         
-    modelo.fit(X, y)
+    modelo.fit(_X, _y)
+    return modelo, confianca
+
+with st.spinner(f"Treinando IA e calculando Variância (R²)..."):
+    modelo, confianca = treinar_modelo(X, y, (chave_filtros, ano_selecionado, coluna_alvo), usar_categoricas, cv_folds, min_leaf, max_depth)
+    preprocessor = modelo.named_steps['preprocessor']
 
 df_modelo['Predito'] = np.expm1(modelo.predict(X))
 df_modelo['Desvio_Perc'] = ((df_modelo[coluna_alvo] - df_modelo['Predito']) / df_modelo['Predito']) * 100
@@ -186,7 +197,9 @@ def agrupar_feature(nome):
     return nome
 
 df_imp['Grupo'] = df_imp['Feature'].apply(agrupar_feature)
-df_imp_group = df_imp.groupby('Grupo')['Importancia'].sum().reset_index().sort_values(by='Importancia', ascending=True)
+# Ordena a Series das somas antes de virar DataFrame: o reset_index só monta as colunas que o px.bar
+# usa nos rótulos, na cor e no hover, sem reordenar um DataFrame
+df_imp_group = df_imp.groupby('Grupo', sort=False)['Importancia'].sum().sort_values(ascending=True).reset_index()
 
 fig_imp = px.bar(
     df_imp_group, x='Importancia', y='Grupo', orientation='h', 
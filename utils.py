@@ -1,6 +1,16 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
+import plotly.graph_objects as go
+import plotly.io as pio
 import io
+import gzip
+import hashlib
+import os
+import tempfile
+import urllib.error
+import urllib.request
+from pathlib import Path
 
 # --- FORMATADORES DE TEXTO E MOEDA ---
 def formata_brl(valor):
@@ -25,7 +35,90 @@ def formata_abrev(valor):
         return str(int(valor))
 
 
+# --- CARREGAMENTO ---
+# Download compartilhado pelo app multipáginas (home.py) e pelo app_bkp.py: no mesmo processo
+# do Streamlit, a mesma URL é baixada uma única vez; cada app aplica seu próprio tratamento.
+# A cópia em disco do CSV, com o ETag do GitHub, sobrevive aos reinícios do container: passado o
+# prazo do cache em memória, o download vira uma requisição condicional (304 se nada mudou).
+MAX_IDADE_DOWNLOAD = 60 * 60
+# Prazo dos dados em memória e no snapshot local (o home.py recarrega a base após esse tempo)
+MAX_IDADE_SNAPSHOT = 12 * 60 * 60
+# Recortes do DataFrame mantidos em cache: um por filtro/versão, descartando os mais antigos
+MAX_RECORTES_EM_CACHE = 8
+
+def caminho_download(url: str) -> Path:
+    """Caminho da cópia local do CSV baixado de uma URL (o ETag fica ao lado, em '.etag')."""
+    chave = hashlib.md5(url.encode()).hexdigest()[:12]
+    return Path(tempfile.gettempdir()) / f"cvm_download_{chave}.csv"
+
+@st.cache_data(ttl=MAX_IDADE_DOWNLOAD, show_spinner=False)
+def baixar_csv(url: str) -> bytes:
+    """Conteúdo bruto do CSV (URL ou caminho local), em cache pela URL."""
+    if not url.startswith(('http://', 'https://')):
+        return Path(url).read_bytes()
+
+    arquivo = caminho_download(url)
+    arquivo_etag = arquivo.with_suffix('.etag')
+    # O CSV é texto: pedido comprimido, trafega uma fração do tamanho (o urllib não negocia sozinho)
+    pedido = urllib.request.Request(url, headers={'Accept-Encoding': 'gzip'})
+    try:
+        copia_local = arquivo.read_bytes()
+        pedido.add_header('If-None-Match', arquivo_etag.read_text())
+    except OSError:
+        copia_local = None
+
+    try:
+        with urllib.request.urlopen(pedido, timeout=60) as resposta:
+            raw = resposta.read()
+            if resposta.headers.get('Content-Encoding') == 'gzip':
+                raw = gzip.decompress(raw)
+            etag = resposta.headers.get('ETag')
+    except urllib.error.HTTPError as erro:
+        if erro.code == 304 and copia_local is not None:
+            return copia_local  # Não mudou no servidor: usa a cópia em disco
+        raise
+
+    if etag:
+        try:
+            arquivo_etag.unlink(missing_ok=True)  # sem ETag, uma cópia gravada pela metade nunca é reaproveitada
+            arquivo.write_bytes(raw)
+            arquivo_etag.write_text(etag)
+        except OSError:
+            pass  # Sem disco gravável o download segue valendo, apenas sem a cópia local
+    return raw
+
+
+def gravar_parquet(df, destino: Path):
+    """Grava o Parquet num temporário da mesma pasta e o move para o destino com os.replace (atômico):
+    uma falha ou gravação concorrente nunca deixa um arquivo truncado no lugar da cópia local."""
+    fd, temporario = tempfile.mkstemp(dir=destino.parent, prefix=f"{destino.stem}.", suffix='.tmp')
+    os.close(fd)
+    try:
+        df.to_parquet(temporario, compression='zstd', engine='pyarrow', index=False)
+        os.replace(temporario, destino)
+    except BaseException:
+        Path(temporario).unlink(missing_ok=True)
+        raise
+
+
 # --- FUNÇÕES AUXILIARES ---
+def maiores_valores(df, col, n=15):
+    """Equivale a df.nlargest(n, col), mas seleciona os candidatos com np.partition em O(N)."""
+    vals = df[col].to_numpy()
+    if len(vals) > n:
+        corte = np.partition(vals, -n)[-n]
+        # Todos os empatados no corte entram como candidatos; a ordenação estável mantém
+        # os primeiros na ordem original, como o keep='first' do nlargest
+        candidatos = np.flatnonzero(vals >= corte)
+    else:
+        candidatos = np.arange(len(vals))
+    ordem = candidatos[np.argsort(-vals[candidatos], kind='stable')][:n]
+    return df.iloc[ordem]
+
+def ordem_crescente(df, col):
+    """Top-N (poucas linhas) em ordem crescente para as barras horizontais; ordenação estável, empates na ordem original."""
+    return df.iloc[np.argsort(df[col].to_numpy(), kind='stable')]
+
 def get_default_index(options_list, default_value):
     """Retorna o índice de um valor padrão numa lista, ou 0 se não for encontrado."""
     try:
@@ -33,27 +126,35 @@ def get_default_index(options_list, default_value):
     except (ValueError, AttributeError):
         return 0
 
-def create_download_button(df, filename):
-    # --- 1. VACINA CONTRA CARACTERES INVISÍVEIS DO EXCEL ---
-    df_clean = df.copy()
-    # Pega apenas as colunas de texto
-    colunas_texto = df_clean.select_dtypes(include=['object', 'string']).columns
-    
-    for col in colunas_texto:
-        # Substitui qualquer caractere de controle (ilegal no Excel/XML) por vazio
-        # \x00-\x08, \x0B-\x0C, \x0E-\x1F são os códigos dos caracteres invisíveis proibidos
-        df_clean[col] = df_clean[col].astype(str).replace(r'[\x00-\x08\x0B-\x0C\x0E-\x1F\x7F-\x9F]', '', regex=True)
-    # -------------------------------------------------------
-
-    # --- 2. GERAÇÃO DO ARQUIVO EXCEL ---
-    buffer = io.BytesIO()
-    with pd.ExcelWriter(buffer, engine='openpyxl') as writer:
-        df_clean.to_excel(writer, index=False, sheet_name='Dados')
+def create_download_button(df, filename, label="📥 Descarregar Dados (Excel)"):
+    # O Excel só é gerado quando o botão é clicado (data= como função, streamlit >= 1.50): montar a
+    # planilha a cada rerun era o passo mais caro das páginas. A cópia é tirada já aqui para o arquivo
+    # refletir os dados exibidos neste rerun; no pandas >= 3 (Copy-on-Write) ela só duplica os dados
+    # se o original for alterado depois, nas versões anteriores é uma cópia completa.
+    df_exibido = df.copy()
+
+    def gerar_excel():
+        # --- 1. VACINA CONTRA CARACTERES INVISÍVEIS DO EXCEL ---
+        df_clean = df_exibido.copy()
+        # Pega apenas as colunas de texto
+        colunas_texto = df_clean.select_dtypes(include=['object', 'string', 'category']).columns
+        
+        for col in colunas_texto:
+            # Substitui qualquer caractere de controle (ilegal no Excel/XML) por vazio
+            # \x00-\x08, \x0B-\x0C, \x0E-\x1F são os códigos dos caracteres invisíveis proibidos
+            df_clean[col] = df_clean[col].astype(str).replace(r'[\x00-\x08\x0B-\x0C\x0E-\x1F\x7F-\x9F]', '', regex=True)
+        # -------------------------------------------------------
+
+        # --- 2. GERAÇÃO DO ARQUIVO EXCEL ---
+        buffer = io.BytesIO()
+        with pd.ExcelWriter(buffer, engine='openpyxl') as writer:
+            df_clean.to_excel(writer, index=False, sheet_name='Dados')
+        return buffer.getvalue()
     
     # --- 3. BOTÃO DO STREAMLIT ---
     st.download_button(
-        label="📥 Descarregar Dados (Excel)",
-        data=buffer.getvalue(),
+        label=label,
+        data=gerar_excel,
         file_name=f"{filename}.xlsx",
         mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
     )
@@ -63,36 +164,170 @@ def renderizar_sidebar_global(df_original):
     """Cria a barra lateral de filtros e aplica o st.session_state para guardar as escolhas."""
     st.sidebar.title("Filtros Globais")
 
+    # As colunas de filtro são categóricas: as categorias já vêm ordenadas e únicas, sem varrer o DataFrame
     # Inicializa as variáveis no Session State se elas não existirem
     if 'uf_selecionada' not in st.session_state: st.session_state['uf_selecionada'] = "TODAS"
     if 'setor_selecionado' not in st.session_state: st.session_state['setor_selecionado'] = "TODOS"
     if 'controle_selecionado' not in st.session_state: st.session_state['controle_selecionado'] = "TODOS"
 
     # Filtro de UF
-    ufs_disponiveis = ["TODAS"] + sorted(df_original['UF_SEDE'].unique())
+    ufs_disponiveis = ["TODAS"] + df_original['UF_SEDE'].cat.categories.tolist()
     idx_uf = get_default_index(ufs_disponiveis, st.session_state['uf_selecionada'])
     uf = st.sidebar.selectbox("UF da Sede", ufs_disponiveis, index=idx_uf)
     st.session_state['uf_selecionada'] = uf # Guarda a escolha
 
     # Filtro de Setor
-    setores_disponiveis = ["TODOS"] + sorted(df_original['SETOR_ATIVIDADE'].unique())
+    setores_disponiveis = ["TODOS"] + df_original['SETOR_ATIVIDADE'].cat.categories.tolist()
     idx_setor = get_default_index(setores_disponiveis, st.session_state['setor_selecionado'])
     setor = st.sidebar.selectbox("Setor de Atividade", setores_disponiveis, index=idx_setor)
     st.session_state['setor_selecionado'] = setor
 
     # Filtro de Controle Acionário
-    controles_disponiveis = ["TODOS"] + sorted(df_original['CONTROLE_ACIONARIO'].unique())
+    controles_disponiveis = ["TODOS"] + df_original['CONTROLE_ACIONARIO'].cat.categories.tolist()
     idx_controle = get_default_index(controles_disponiveis, st.session_state['controle_selecionado'])
     controle = st.sidebar.selectbox("Controle Acionário", controles_disponiveis, index=idx_controle)
     st.session_state['controle_selecionado'] = controle
 
-    # Aplica os filtros ao DataFrame
-    df_filtrado = df_original.copy()
+    # Chave que identifica o DataFrame filtrado (versão dos dados + filtros), usada pelos caches das páginas
+    chave_filtros = (df_original.attrs.get('versao'), uf, setor, controle)
+    st.session_state['chave_filtros'] = chave_filtros
+
+    return aplicar_filtros_globais(df_original, *chave_filtros)
+
+def aplicar_filtros_globais(df_original, versao, uf, setor, controle):
+    """Aplica os filtros globais ao DataFrame. Só as posições das linhas ficam em cache: um DataFrame em
+    st.cache_data seria copiado (unpickle) a cada rerun, mais caro que o próprio recorte."""
+    # Sem filtro ativo as páginas recebem o próprio DataFrame (só o leem): nem consulta ao cache nem cópia
+    if (uf, setor, controle) == ("TODAS", "TODOS", "TODOS"):
+        return df_original
+    return df_original.take(indice_filtros(df_original, versao, uf, setor, controle))
+
+@st.cache_data(ttl=MAX_IDADE_SNAPSHOT, max_entries=64)
+def indice_filtros(_df_original, versao, uf, setor, controle):
+    """Posições das linhas que atendem aos filtros globais, em cache por (versão dos dados, uf, setor, controle)."""
+    # Compõe uma única máscara sobre o DataFrame
+    mask = np.ones(len(_df_original), dtype=bool)
     if uf != "TODAS":
-        df_filtrado = df_filtrado[df_filtrado['UF_SEDE'] == uf]
+        mask &= (_df_original['UF_SEDE'] == uf).to_numpy()
     if setor != "TODOS":
-        df_filtrado = df_filtrado[df_filtrado['SETOR_ATIVIDADE'] == setor]
+        mask &= (_df_original['SETOR_ATIVIDADE'] == setor).to_numpy()
     if controle != "TODOS":
-        df_filtrado = df_filtrado[df_filtrado['CONTROLE_ACIONARIO'] == controle]
+        mask &= (_df_original['CONTROLE_ACIONARIO'] == controle).to_numpy()
+    return np.flatnonzero(mask)
+
+# --- AGREGAÇÕES EM CACHE ---
+# O DataFrame filtrado é passado com '_' (não entra no hash do Streamlit); quem o identifica
+# no cache é a 'chave_filtros' gravada pela barra lateral global.
+@st.cache_data
+def opcoes_unicas(_df, chave, col, reverse=False):
+    """Lista ordenada dos valores distintos de uma coluna, para os selectbox. 'chave' identifica o _df."""
+    if isinstance(_df[col].dtype, pd.CategoricalDtype):
+        # As categorias já estão ordenadas: basta descartar as que não aparecem no recorte
+        opcoes = _df[col].cat.remove_unused_categories().cat.categories.tolist()
+        return opcoes[::-1] if reverse else opcoes
+    return sorted(_df[col].unique(), reverse=reverse)
+
+@st.cache_data
+def opcoes_do_recorte(_df, chave, col_filtro, valor, col, reverse=False):
+    """Como opcoes_unicas, mas só entre as linhas com col_filtro == valor (selectbox em cascata). O recorte
+    só é feito quando a seleção não está em cache: nos reruns seguintes o DataFrame não é varrido."""
+    return opcoes_unicas(_df[_df[col_filtro] == valor], (chave, valor), col, reverse)
+
+# cache_resource: o índice é compartilhado sem cópia entre reruns; as páginas só leem recortes dele
+@st.cache_resource(ttl=MAX_IDADE_SNAPSHOT, max_entries=MAX_RECORTES_EM_CACHE)
+def indexar_por_empresa(_df, chave_filtros):
+    """DataFrame indexado e ordenado por (empresa, órgão), para recortes por busca binária no índice."""
+    return _df.set_index(['NOME_COMPANHIA', 'ORGAO_ADMINISTRACAO'], drop=False).sort_index()
+
+def recortar_empresa(df_indexado, empresa, orgao=None):
+    """Linhas de uma empresa (e, opcionalmente, de um órgão) a partir do DataFrame de indexar_por_empresa."""
+    return _recortar_bloco(df_indexado, (empresa,) if orgao is None else (empresa, orgao))
+
+@st.cache_resource(ttl=MAX_IDADE_SNAPSHOT, max_entries=MAX_RECORTES_EM_CACHE)
+def indexar_por_ano(_df, chave_filtros):
+    """DataFrame indexado e ordenado por (ano, órgão); a ordenação estável mantém a ordem original das linhas.
+    Linhas sem ano ficam de fora: nenhuma seleção de ano as alcança, e o NaN impediria a busca binária."""
+    df_com_ano = _df[_df['ANO_REFER'].notna()]
+    df_ordenado = df_com_ano.sort_values(['ANO_REFER', 'ORGAO_ADMINISTRACAO'], kind='stable')
+    return df_ordenado.set_index(['ANO_REFER', 'ORGAO_ADMINISTRACAO'], drop=False)
+
+def recortar_ano(df_indexado, ano, orgao=None):
+    """Linhas de um ano (e, opcionalmente, de um órgão) a partir do DataFrame de indexar_por_ano. Sem órgão,
+    as linhas do ano vêm agrupadas por órgão; dentro de cada (ano, órgão) seguem a ordem original."""
+    return _recortar_bloco(df_indexado, (ano,) if orgao is None else (ano, orgao))
+
+def _recortar_bloco(df_indexado, chave):
+    # Índice ordenado: as linhas da chave são um bloco contíguo, localizado por busca binária
+    try:
+        inicio, fim = df_indexado.index.slice_locs(chave, chave)
+    except (KeyError, TypeError):  # valor fora das categorias do índice
+        inicio = fim = 0
+    return df_indexado.iloc[inicio:fim].reset_index(drop=True)
 
-    return df_filtrado
+@st.cache_data(ttl=MAX_IDADE_SNAPSHOT, max_entries=MAX_RECORTES_EM_CACHE)
+def posicoes_por_ano(_df, chave_filtros):
+    """Dicionário ano -> posições das linhas do ano, montado uma vez por filtro. O df.iloc com elas mantém o
+    índice e a ordem originais (igual ao recorte por máscara), sem guardar outra cópia do DataFrame."""
+    return _df.groupby('ANO_REFER', sort=False).indices
+
+@st.cache_data
+def evolucao_anual(_df_sel, chave, agregacao):
+    """Agregação por ano de um recorte (empresa/órgão), identificado por 'chave'. O cálculo por membro
+    é feito pelas páginas sobre o resultado, então trocar 'Total'/'Média' não refaz o groupby."""
+    return _df_sel.groupby('ANO_REFER').agg(agregacao).reset_index()
+
+@st.cache_data
+def fatos_empresas(_df, chave_filtros, por_orgao=True):
+    """Tabela de fatos por (ano, órgão, empresa) — ou (ano, empresa) — com a soma das métricas e o
+    primeiro nº de membros de cada grupo. Os rankings recortam dela em vez de reagrupar o DataFrame."""
+    chaves = ['ANO_REFER', 'ORGAO_ADMINISTRACAO', 'NOME_COMPANHIA'] if por_orgao else ['ANO_REFER', 'NOME_COMPANHIA']
+    colunas = _df.select_dtypes('number').columns.drop('ANO_REFER')
+    agregacao = {col: 'first' if col.startswith('NUM_MEMBROS') else 'sum' for col in colunas}
+    return _df.groupby(chaves, observed=True).agg(agregacao).sort_index()
+
+def recortar_fatos(fatos, chave):
+    """Linhas da tabela de fatos cujo índice começa por 'chave' (ex.: (ano,)), sem esses níveis. Uma chave
+    ausente (ano sem linhas, NaN ou valor fora das categorias) dá um recorte vazio, como o filtro booleano."""
+    try:
+        inicio, fim = fatos.index.slice_locs(chave, chave)
+    except (KeyError, TypeError):  # valor fora das categorias do índice
+        inicio = fim = 0
+    return fatos.iloc[inicio:fim].droplevel(list(range(len(chave))))
+
+@st.cache_data
+def ranking_empresas(_df, chave_filtros, ano, orgao, col_rank, col_membros, calc_type, n=15):
+    """Top-N de empresas por uma métrica num ano (e, opcionalmente, num órgão), por Total ou Média por Membro."""
+    fatos = fatos_empresas(_df, chave_filtros, orgao is not None)
+    # Fica só o nível da empresa no índice, como no groupby('NOME_COMPANHIA')
+    df_fatos = recortar_fatos(fatos, (ano,) if orgao is None else (ano, orgao))
+
+    if calc_type == "Total":
+        return maiores_valores(df_fatos[[col_rank]], col_rank, n).reset_index()
+
+    df_agg = pd.DataFrame({'Valor': df_fatos[col_rank], 'Membros': df_fatos[col_membros]}).reset_index()
+    df_agg = df_agg[df_agg['Membros'] > 0]
+    df_agg[col_rank] = df_agg['Valor'] / df_agg['Membros']
+    return maiores_valores(df_agg, col_rank, n)
+
+@st.cache_data(max_entries=64)
+def figura_ranking(_df_rank, chave, col_rank, titulo, template=None, labels=None, **layout):
+    """Barras horizontais do Top-N, em cache por 'chave' (filtros + seleção do ranking): ao voltar a uma
+    seleção já vista, a figura não é refeita."""
+    # go.Bar direto dos arrays, com os mesmos atributos que o px.bar(orientation='h', text_auto='.2s')
+    # produzia (rótulos, hover, cor do template), sem a camada de inferência do plotly.express
+    df_plot = ordem_crescente(_df_rank, col_rank)
+    labels = labels or {}
+    rotulo_x, rotulo_y = labels.get(col_rank, col_rank), labels.get('NOME_COMPANHIA', 'NOME_COMPANHIA')
+    tema = pio.templates[template if template is not None else pio.templates.default]
+    fig = go.Figure(
+        go.Bar(x=df_plot[col_rank].to_numpy(), y=df_plot['NOME_COMPANHIA'].to_numpy(), orientation='h',
+               texttemplate='%{x:.2s}', textposition='auto', name='', legendgroup='', showlegend=False,
+               hovertemplate=f"{rotulo_x}=%{{x}}<br>{rotulo_y}=%{{y}}<extra></extra>",
+               marker={'color': tema.layout.colorway[0], 'pattern': {'shape': ''}}, xaxis='x', yaxis='y'),
+        layout={'template': tema, 'title': {'text': titulo}, 'barmode': 'relative', 'legend': {'tracegroupgap': 0},
+                'xaxis': {'anchor': 'y', 'domain': [0.0, 1.0], 'title': {'text': rotulo_x}},
+                'yaxis': {'anchor': 'x', 'domain': [0.0, 1.0], 'title': {'text': rotulo_y}}},
+    )
+    # Separadores brasileiros por padrão; quem chama pode trocá-los pelo 'layout' (separators=None: os do Plotly)
+    fig.update_layout(yaxis={'categoryorder':'total ascending'}, **{'separators': ",.", **layout})
+    return fig